@@ -48,7 +48,7 @@ class Autoencoder:
         mse = tf.reduce_mean(tf.square(y_true - y_pred), axis=1)
         return tf.reduce_mean(tf.cast(mse < self.mse_threshold, tf.float32))
 
-    def train(self, X_train, X_val, epochs=150, batch_size=128):
+    def train(self, X_train, X_val, epochs=150, batch_size=128, verbose=1):
         callbacks = [
             EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
             ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
@@ -60,6 +60,6 @@ class Autoencoder:
             epochs=epochs,
             batch_size=batch_size,
             callbacks=callbacks,
-            verbose=1
+            verbose=verbose
         )
         return history
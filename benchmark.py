@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+import serve
+from local_redis import LocalRedis
+from log_writer import BufferedLogWriter
+from preprocess import StreamingStats
+from record_codec import RecordSchema, register_schema
+
+stages = ('produce', 'read', 'parse', 'scale', 'predict', 'persist')
+
+
+def load_rows(input_file, count):
+    """Recorded feature rows as stream entries, repeated until there are `count` of them."""
+    with open(input_file) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    rows = [dict(zip(serve.all_fields, line.split(',')[:len(serve.all_fields)])) for line in lines]
+    return [rows[i % len(rows)] for i in range(count)]
+
+def train_synthetic_model(entries, work_dir, archi='U16,U8,U16', epochs=3):
+    """Small autoencoder, scaler and threshold fitted on the benchmark rows themselves."""
+    import autoencoder
+    import numpy_model
+
+    feature_columns = [f'col{i}' for i in range(4, len(serve.all_fields))]
+    log_rows = serve.build_feature_matrix(entries, feature_columns)
+    stats = StreamingStats.from_chunks([log_rows], feature_columns)
+    standard_scaler = stats.standard_scaler()
+    x_scaled = standard_scaler.transform(log_rows)
+
+    wrapper = autoencoder.Autoencoder(num_features=len(feature_columns), archi=archi, reg='l2', loss='mse',
+                                      verbose=False)
+    wrapper.model.fit(x_scaled, x_scaled, epochs=epochs, batch_size=256, verbose=0)
+    errors = np.mean(np.square(x_scaled - wrapper.model.predict(x_scaled, verbose=0)), axis=1)
+    threshold = float(np.mean(errors) + 3 * np.std(errors))
+
+    weights_file = os.path.join(work_dir, 'model_weights.npz')
+    numpy_model.export_weights(wrapper.model, weights_file)
+    return wrapper.model, weights_file, standard_scaler, threshold, feature_columns
+
+def summarize(samples, rows):
+    samples = np.asarray(samples, dtype=np.float64)
+    total = float(samples.sum())
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000 if len(samples) else (0.0, 0.0, 0.0)
+    return {
+        'calls': len(samples),
+        'seconds': total,
+        'rows_per_sec': rows / total if total else None,
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+def run(entries, model, standard_scaler, threshold, feature_columns, work_dir, batch_size=256,
+        max_latency_ms=20, record_format='text', rate=0.0):
+    """
+    Push the entries through BufferedLogWriter into a LocalRedis stream from a
+    producer thread, while this thread consumes them with the serve.py code:
+    read_batch, decode_entries, scaler, predict_batch, write_results and the
+    results ring. Returns per-stage timings and per-row end-to-end latency.
+    """
+    r = LocalRedis()
+    encoder = decoder = None
+    if record_format == 'packed':
+        schema = RecordSchema(serve.all_fields)
+        register_schema(r, schema)
+        encoder = schema.encode
+        decoder = serve.record_decoder(r, record_format)
+    writer = BufferedLogWriter(os.path.join(work_dir, 'network_log.txt'), r, serve.all_fields,
+                               maxlen=len(entries) + 1, encoder=encoder)
+    ring = serve.open_ring(os.path.join(work_dir, 'results_ring.bin'), feature_columns, 100000)
+    results_file = os.path.join(work_dir, 'classified_results.txt')
+
+    timings = {stage: [] for stage in stages}
+    produced_at = np.zeros(len(entries))
+    done_at = np.zeros(len(entries))
+
+    def produce():
+        start = time.perf_counter()
+        for i, entry in enumerate(entries):
+            if rate > 0:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            produced_at[i] = t0
+            writer.write(entry)
+            timings['produce'].append(time.perf_counter() - t0)
+        writer.close()
+
+    producer = threading.Thread(target=produce, name='producer')
+    start = time.perf_counter()
+    producer.start()
+
+    consumed = 0
+    last_id = '0-0'
+    while consumed < len(entries):
+        t0 = time.perf_counter()
+        batch, last_id = serve.read_batch(r, last_id, batch_size, max_latency_ms)
+        t1 = time.perf_counter()
+        lines, log_rows = serve.decode_entries(batch, feature_columns, decoder)
+        t2 = time.perf_counter()
+        log_scaled = standard_scaler.transform(log_rows)
+        t3 = time.perf_counter()
+        results, reconstruction_errors = serve.predict_batch(model, log_scaled, threshold)
+        t4 = time.perf_counter()
+        serve.write_results(results, lines, results_file)
+        ring.append(results, reconstruction_errors, log_rows)
+        t5 = time.perf_counter()
+
+        for stage, seconds in zip(stages[1:], (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+            timings[stage].append(seconds)
+        done_at[consumed:consumed + len(batch)] = t5
+        consumed += len(batch)
+
+    wall = time.perf_counter() - start
+    producer.join()
+    ring.close()
+
+    report = {'rows': len(entries), 'wall_seconds': wall, 'rows_per_sec': len(entries) / wall, 'stages': {}}
+    for stage in stages:
+        report['stages'][stage] = summarize(timings[stage], len(entries))
+    latency = (done_at - produced_at) * 1000
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+    report['end_to_end_ms'] = {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(latency.max())}
+    return report
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(report, baseline=None):
+    print(f"{report['rows']} rows in {report['wall_seconds']:.2f}s ({report['rows_per_sec']:.0f} rows/sec)")
+    print(f"{'stage':<10}{'calls':>8}{'rows/sec':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          + (f"{'vs base':>10}" if baseline else ''))
+    for stage, summary in report['stages'].items():
+        rows_per_sec = summary['rows_per_sec'] or 0
+        line = (f"{stage:<10}{summary['calls']:>8}{rows_per_sec:>12.0f}{summary['p50_ms']:>10.3f}"
+                f"{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}")
+        base = baseline['stages'].get(stage, {}).get('rows_per_sec') if baseline else None
+        if base:
+            line += f"{(rows_per_sec / base - 1) * 100:>+9.1f}%"
+        print(line)
+    latency = report['end_to_end_ms']
+    print(f"end to end: p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, p99 {latency['p99']:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark write_log -> Redis stream -> scoring -> results with recorded rows')
+    parser.add_argument('--input_file', default='pyshark_network_log.txt', help='Recorded feature rows to replay')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--max_latency_ms', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=0.0, help='Rows/sec offered by the producer, 0 for as fast as possible')
+    parser.add_argument('--record_format', choices=['text', 'packed'], default='text')
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='numpy')
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64', help='Precision of the numpy engine')
+    parser.add_argument('--archi', default='U16,U8,U16', help='Architecture of the synthetic model')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--output', default=None, help='Write the report to this JSON file')
+    parser.add_argument('--baseline', default=None, help='Earlier JSON report to compare stage throughput against')
+    args = parser.parse_args()
+
+    entries = load_rows(args.input_file, args.rows)
+    with tempfile.TemporaryDirectory() as work_dir:
+        print("Training the synthetic model...")
+        keras_model, weights_file, standard_scaler, threshold, feature_columns = train_synthetic_model(
+            entries, work_dir, args.archi, args.epochs)
+        model = keras_model if args.engine == 'keras' else serve.load_model(
+            engine='numpy', weights_file=weights_file, dtype=args.dtype)
+        report = run(entries, model, standard_scaler, threshold, feature_columns, work_dir, args.batch_size,
+                     args.max_latency_ms, args.record_format, args.rate)
+
+    report['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    report['revision'] = git_revision()
+    report['timestamp'] = time.time()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
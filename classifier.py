@@ -1,27 +1,17 @@
-# Paths to input and output files
-input_file = r"C:\Users\Anshuman\Desktop\Hackathon\HackByte\DataFiles\KDD\kddcup.data_10_percent_corrected"
-normal_file = r"C:\Users\Anshuman\Desktop\Hackathon\HackByte\DataFiles\normal.txt"
-sus_file = r"C:\Users\Anshuman\Desktop\Hackathon\HackByte\DataFiles\sus.txt"
+import argparse
+import time
+import split_dataset
 
-# Counters (optional but useful)
-normal_count = 0
-sus_count = 0
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split a KDD file into normal and suspicious rows, without the label column')
+    parser.add_argument('--input_file', default='DataFiles/KDD/kddcup.data_10_percent_corrected')
+    parser.add_argument('--normal_file', default='DataFiles/normal.txt')
+    parser.add_argument('--sus_file', default='DataFiles/sus.txt')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
 
-# Process the dataset and split it
-with open(input_file, "r") as infile, \
-     open(normal_file, "w") as normal_out, \
-     open(sus_file, "w") as sus_out:
-    
-    for line in infile:
-        line = line.strip()
-        if not line:
-            continue  # skip empty lines
-        parts = line.split(',')
-        label = parts[-1].strip().lower()
-
-        if label == "normal.":
-            normal_out.write(','.join(parts[:-1]) + '\n')
-            normal_count += 1
-        else:
-            sus_out.write(','.join(parts[:-1]) + '\n')
-            sus_count += 1
+    start = time.time()
+    counts = split_dataset.split_dataset(args.input_file, {'normal': args.normal_file, 'suspicious': args.sus_file},
+                                         strip_label=True, workers=args.workers)
+    print(f"Normal records: {counts['normal']}, suspicious records: {counts['suspicious']} "
+          f"in {time.time() - start:.2f}s")
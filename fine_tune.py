@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+import joblib
+import numpy as np
+from numpy_model import NumpyAutoencoder
+from preprocess import StreamingStats
+
+
+class Reservoir:
+    """Uniform sample (Algorithm R) of at most `capacity` of all the rows added so far."""
+
+    def __init__(self, capacity, num_features, seed=None):
+        self.capacity = capacity
+        self.rows = np.empty((capacity, num_features))
+        self.size = 0
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def add(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if not len(rows):
+            return
+        with self.lock:
+            free = min(self.capacity - self.size, len(rows))
+            self.rows[self.size:self.size + free] = rows[:free]
+            self.size += free
+            rest = rows[free:]
+            if len(rest):
+                # Row i of the stream replaces a random slot with probability capacity / (i + 1)
+                slots = self.rng.integers(0, self.seen + free + np.arange(1, len(rest) + 1))
+                keep = slots < self.capacity
+                self.rows[slots[keep]] = rest[keep]
+            self.seen += len(rows)
+
+    def sample(self):
+        with self.lock:
+            return self.rows[:self.size].copy()
+
+
+class ModelState:
+    """Everything the scorer needs from one model version; replaced as a whole, never modified."""
+
+    def __init__(self, version, model, standard_scaler, threshold):
+        self.version = version
+        self.model = model
+        self.standard_scaler = standard_scaler
+        self.threshold = float(threshold)
+        self.published = time.perf_counter()
+
+
+def save_artifacts(keras_model, standard_scaler, threshold, version, model_file, scaler_file, threshold_file,
+                   weights_file=None):
+    # Each file is replaced atomically, the threshold last so a restart never pairs it with an older model
+    import numpy_model
+    from threshold_calibrator import write_json_atomic
+
+    tmp_model = model_file + '.tmp.h5'
+    keras_model.save(tmp_model)
+    os.replace(tmp_model, model_file)
+    if weights_file:
+        tmp_weights = weights_file + '.tmp.npz'
+        numpy_model.export_weights(keras_model, tmp_weights)
+        os.replace(tmp_weights, weights_file)
+    tmp_scaler = scaler_file + '.tmp'
+    joblib.dump(standard_scaler, tmp_scaler)
+    os.replace(tmp_scaler, scaler_file)
+    write_json_atomic({'threshold': float(threshold), 'model_version': version}, threshold_file)
+
+
+class FineTuner:
+    """
+    Keeps a reservoir sample of the rows the live scorer classified as normal
+    and, every `interval` seconds on a background thread, fine-tunes a copy
+    of the Keras model on it for a few epochs. The copy, a scaler refitted
+    on the sample and a threshold from its reconstruction errors (mean + 3
+    std, as in main.py) are published together as a new ModelState. The
+    scorer reads `state` once per batch, so the swap is a single reference
+    assignment and scoring never waits for training.
+    """
+
+    def __init__(self, keras_model, model, standard_scaler, threshold, feature_columns, engine='keras',
+                 dtype='float64', interval=600.0, capacity=100000, min_rows=10000, epochs=3, batch_size=1024,
+                 learning_rate=1e-4, loss='mse', refit_scaler=True, artifact_paths=None, seed=None):
+        self.keras_model = keras_model
+        self.feature_columns = list(feature_columns)
+        self.engine = engine
+        self.dtype = dtype
+        self.interval = interval
+        self.min_rows = min_rows
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.loss = loss
+        self.refit_scaler = refit_scaler
+        # (model_file, scaler_file, threshold_file, weights_file) to persist every new version to, or None
+        self.artifact_paths = artifact_paths
+        self.reservoir = Reservoir(capacity, len(self.feature_columns), seed)
+        self.state = ModelState(0, model, standard_scaler, threshold)
+        self.swaps = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add(self, rows):
+        self.reservoir.add(rows)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='fine-tuner', daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            if self.reservoir.size < self.min_rows:
+                print(f"Fine-tuning skipped, {self.reservoir.size} of {self.min_rows} normal rows sampled")
+                continue
+            try:
+                self.fine_tune()
+            except Exception as e:
+                # The live model keeps scoring, try again next interval
+                print("Fine-tuning failed:", e)
+
+    def fine_tune(self):
+        """Train the next model version on the current sample and publish it."""
+        from tensorflow.keras.models import clone_model
+        from tensorflow.keras.optimizers import Adam
+
+        start = time.perf_counter()
+        rows = self.reservoir.sample()
+        current = self.state
+        standard_scaler = current.standard_scaler
+        if self.refit_scaler:
+            standard_scaler = StreamingStats.from_chunks([rows], self.feature_columns).standard_scaler()
+        x = standard_scaler.transform(rows)
+
+        model = clone_model(self.keras_model)
+        model.set_weights(self.keras_model.get_weights())
+        model.compile(optimizer=Adam(learning_rate=self.learning_rate), loss=self.loss)
+        model.fit(x, x, epochs=self.epochs, batch_size=self.batch_size, shuffle=True, verbose=0)
+        errors = np.mean(np.square(x - model.predict(x, batch_size=8192, verbose=0)), axis=1)
+        threshold = float(np.mean(errors) + 3 * np.std(errors))
+        train_seconds = time.perf_counter() - start
+
+        version = current.version + 1
+        if self.artifact_paths:
+            save_artifacts(model, standard_scaler, threshold, version, *self.artifact_paths)
+        serving_model = model if self.engine == 'keras' else NumpyAutoencoder.from_keras(model, dtype=self.dtype)
+        self.keras_model = model
+        self.swaps.append({'version': version, 'rows': len(rows), 'train_seconds': train_seconds,
+                           'threshold': threshold, 'swap_ms': None, 'switch_us': None})
+        self.state = ModelState(version, serving_model, standard_scaler, threshold)
+        print(f"Fine-tuned model version {version} on {len(rows)} normal rows in {train_seconds:.1f}s, "
+              f"threshold {current.threshold:.6f} -> {threshold:.6f}")
+        return self.state
+
+    def swapped(self, state, switch_seconds=0.0):
+        """
+        Called by the scorer once it scores with `state`, with the time its
+        own switch took. Returns the seconds since the state was published.
+        """
+        latency = time.perf_counter() - state.published
+        for swap in self.swaps:
+            if swap['version'] == state.version:
+                swap['swap_ms'] = latency * 1000
+                swap['switch_us'] = switch_seconds * 1e6
+        print(f"Scoring with model version {state.version}: live {latency * 1000:.2f} ms after publishing, "
+              f"switch took {switch_seconds * 1e6:.0f} us")
+        return latency
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
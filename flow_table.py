@@ -0,0 +1,223 @@
+import sys
+from collections import OrderedDict
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+TCP_URG = 0x20
+
+# FlowRecord.state bits
+ORIG_SYN = 0x01
+RESP_SYN_ACK = 0x02
+ORIG_FIN = 0x04
+RESP_FIN = 0x08
+ORIG_RST = 0x10
+RESP_RST = 0x20
+CLOSED = 0x40
+
+
+class PacketInfo:
+    """The header fields the feature extractor needs from one packet."""
+    __slots__ = ('timestamp', 'src', 'dst', 'protocol', 'sport', 'dport', 'length', 'frag_offset', 'flags')
+
+    def __init__(self, timestamp=0.0, src='', dst='', protocol='tcp', sport=0, dport=0,
+                 length=0, frag_offset=0, flags=0):
+        self.timestamp = timestamp
+        self.src = src
+        self.dst = dst
+        self.protocol = protocol
+        self.sport = sport
+        self.dport = dport
+        self.length = length
+        self.frag_offset = frag_offset
+        self.flags = flags
+
+
+class FlowRecord:
+    """One bidirectional connection. src/sport is the side that sent the first packet."""
+    __slots__ = ('key', 'src', 'dst', 'sport', 'dport', 'protocol', 'first_seen', 'last_seen',
+                 'src_bytes', 'dst_bytes', 'packets', 'wrong_fragment', 'urgent', 'state')
+
+    def __init__(self, key, info):
+        self.key = key
+        self.src = info.src
+        self.dst = info.dst
+        self.sport = info.sport
+        self.dport = info.dport
+        self.protocol = info.protocol
+        self.first_seen = info.timestamp
+        self.last_seen = info.timestamp
+        self.src_bytes = 0
+        self.dst_bytes = 0
+        self.packets = 0
+        self.wrong_fragment = 0
+        self.urgent = 0
+        self.state = 0
+
+    @property
+    def duration(self):
+        return self.last_seen - self.first_seen
+
+    @property
+    def closed(self):
+        return bool(self.state & CLOSED)
+
+    def kdd_flag(self):
+        # Connection status as in the KDD 'flag' column, from the TCP flags seen in each direction
+        if self.protocol != 'tcp':
+            return 'SF'
+        state = self.state
+        if not state & ORIG_SYN:
+            return 'OTH'
+        if not state & RESP_SYN_ACK:
+            if state & RESP_RST:
+                return 'REJ'
+            if state & ORIG_RST:
+                return 'RSTOS0'
+            return 'SH' if state & ORIG_FIN else 'S0'
+        if state & ORIG_RST:
+            return 'RSTO'
+        if state & RESP_RST:
+            return 'RSTR'
+        if state & ORIG_FIN and state & RESP_FIN:
+            return 'SF'
+        if state & ORIG_FIN:
+            return 'S2'
+        if state & RESP_FIN:
+            return 'S3'
+        return 'S1'
+
+
+def flow_key(info):
+    # Both directions of a connection share one key
+    if (info.src, info.sport) <= (info.dst, info.dport):
+        return (info.protocol, info.src, info.sport, info.dst, info.dport)
+    return (info.protocol, info.dst, info.dport, info.src, info.sport)
+
+def _estimate_flow_bytes():
+    # Record + key tuple + the OrderedDict entry that holds it
+    sample = FlowRecord(('tcp', '255.255.255.255', 65535, '255.255.255.255', 65535), PacketInfo())
+    record = sys.getsizeof(sample) + sum(sys.getsizeof(getattr(sample, slot)) for slot in ('first_seen', 'last_seen'))
+    key = sys.getsizeof(sample.key) + 2 * sys.getsizeof(sample.src)
+    return record + key + 104
+
+flow_bytes = _estimate_flow_bytes()
+
+
+class FlowTable:
+    """
+    Live connections keyed by 5-tuple, kept in least-recently-seen order.
+
+    A flow ends when TCP closes it (RST, or FIN from both sides), when it has
+    been idle for idle_timeout seconds, when it has been open for
+    active_timeout seconds, or when it is evicted to stay under max_bytes.
+    Closed TCP flows stay in the table until they go idle so trailing ACKs
+    are absorbed instead of opening a new flow.
+    """
+
+    def __init__(self, idle_timeout=15, active_timeout=120, max_bytes=64 * 1024 * 1024):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max(1, max_bytes // flow_bytes)
+        self.flows = OrderedDict()
+        self.ended = []
+        self.completed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def update(self, info):
+        """
+        Account one packet. Returns the flow if this packet ended it
+        (TCP close or active timeout), otherwise None.
+        """
+        key = flow_key(info)
+        flows = self.flows
+        flow = flows.get(key)
+        now = info.timestamp
+
+        if flow is not None and (flow.closed and info.flags & TCP_SYN and not info.flags & TCP_ACK):
+            # A new connection reusing the 5-tuple of a closed one
+            del flows[key]
+            flow = None
+
+        if flow is None:
+            flow = FlowRecord(key, info)
+            flows[key] = flow
+            if len(flows) > self.max_flows:
+                self._evict()
+        else:
+            flows.move_to_end(key)
+
+        flow.last_seen = now
+        flow.packets += 1
+        forward = info.src == flow.src and info.sport == flow.sport
+        if forward:
+            flow.src_bytes += info.length
+        else:
+            flow.dst_bytes += info.length
+        if info.frag_offset:
+            flow.wrong_fragment += 1
+
+        flags = info.flags
+        if flags and not flow.closed:
+            flow.urgent += bool(flags & TCP_URG)
+            if forward:
+                if flags & TCP_SYN and not flags & TCP_ACK:
+                    flow.state |= ORIG_SYN
+                if flags & TCP_FIN:
+                    flow.state |= ORIG_FIN
+                if flags & TCP_RST:
+                    flow.state |= ORIG_RST
+            else:
+                if flags & TCP_SYN and flags & TCP_ACK:
+                    flow.state |= RESP_SYN_ACK
+                if flags & TCP_FIN:
+                    flow.state |= RESP_FIN
+                if flags & TCP_RST:
+                    flow.state |= RESP_RST
+            if flow.state & (ORIG_RST | RESP_RST) or (flow.state & ORIG_FIN and flow.state & RESP_FIN):
+                flow.state |= CLOSED
+                self.completed += 1
+                return flow
+
+        if not flow.closed and now - flow.first_seen >= self.active_timeout:
+            # Long-lived flows are reported in slices, the next packet starts a new record
+            del flows[key]
+            self.completed += 1
+            return flow
+        return None
+
+    def _evict(self):
+        _, flow = self.flows.popitem(last=False)
+        self.evicted += 1
+        if not flow.closed:
+            self.ended.append(flow)
+
+    def expire(self, now):
+        """Flows that went idle before `now`, plus any evicted since the last call."""
+        ended, self.ended = self.ended, []
+        flows = self.flows
+        cutoff = now - self.idle_timeout
+        while flows:
+            flow = next(iter(flows.values()))
+            if flow.last_seen > cutoff:
+                break
+            flows.popitem(last=False)
+            if not flow.closed:
+                self.expired += 1
+                ended.append(flow)
+        return ended
+
+    def stats(self):
+        return {
+            'live_flows': len(self.flows),
+            'completed': self.completed,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'bytes_used': len(self.flows) * flow_bytes,
+            'max_flows': self.max_flows,
+        }
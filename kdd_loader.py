@@ -0,0 +1,108 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+
+num_columns = 42
+columns = [f'col{i}' for i in range(num_columns)]
+categorical_columns = ['col1', 'col2', 'col3']
+label_column = 'col41'
+# Same columns main.py trains on: everything but duration, the categoricals and the label
+numeric_columns = [f'col{i}' for i in range(4, 41)]
+
+dtypes = {col: np.float64 for col in numeric_columns}
+dtypes.update({col: 'category' for col in categorical_columns})
+dtypes['col0'] = np.float64
+dtypes[label_column] = str
+
+cache_version = 1
+
+
+def file_key(data_path, block_bytes=8 << 20):
+    """
+    Cache key for a data file: a hash of its whole content, streamed in
+    blocks. Hashing is several times faster than parsing, so the key stays
+    cheap next to the parse it saves.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{cache_version}'.encode())
+    with open(data_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_normal_chunks(data_path, chunksize=200000):
+    """Parse the KDD file in chunks with fixed dtypes, yielding the numeric columns of the normal rows."""
+    reader = pd.read_csv(data_path, header=None, names=columns, dtype=dtypes,
+                         usecols=numeric_columns + [label_column], chunksize=chunksize)
+    for chunk in reader:
+        normal = chunk[label_column].str.strip().str.lower().str.startswith('normal')
+        yield chunk.loc[normal.to_numpy(), numeric_columns].to_numpy(dtype=np.float64)
+
+def _write_npy(path, chunks, num_features):
+    # Stream the rows to a raw file first, the .npy header needs the final row count
+    raw_path = path + '.raw'
+    rows = 0
+    with open(raw_path, 'wb') as raw:
+        for chunk in chunks:
+            raw.write(np.ascontiguousarray(chunk).tobytes())
+            rows += len(chunk)
+
+    tmp_path = path + '.tmp'
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+              'fortran_order': False, 'shape': (rows, num_features)}
+    with open(tmp_path, 'wb') as out, open(raw_path, 'rb') as raw:
+        np.lib.format.write_array_header_1_0(out, header)
+        while True:
+            block = raw.read(1 << 24)
+            if not block:
+                break
+            out.write(block)
+    os.remove(raw_path)
+    os.replace(tmp_path, path)
+    return rows
+
+def load_normal_numeric(data_path, cache_dir='cache', chunksize=200000, use_cache=True, verbose=True):
+    """
+    Numeric feature matrix of the normal rows of a KDD file, as a read-only
+    memory map of a cached .npy file. The first call parses the CSV in
+    chunks and writes the cache, later calls only open it.
+    """
+    if not use_cache:
+        parts = list(iter_normal_chunks(data_path, chunksize))
+        matrix = np.concatenate(parts) if parts else np.empty((0, len(numeric_columns)))
+        return matrix, list(numeric_columns)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = file_key(data_path)
+    cache_path = os.path.join(cache_dir, f'kdd_normal_{key}.npy')
+    meta_path = os.path.join(cache_dir, f'kdd_normal_{key}.json')
+
+    if not (os.path.exists(cache_path) and os.path.exists(meta_path)):
+        start = time.time()
+        rows = _write_npy(cache_path, iter_normal_chunks(data_path, chunksize), len(numeric_columns))
+        with open(meta_path, 'w') as f:
+            json.dump({'data_path': os.path.abspath(data_path), 'rows': rows, 'columns': numeric_columns}, f)
+        if verbose:
+            print(f"Cached {rows} normal rows of {data_path} to {cache_path} in {time.time() - start:.1f}s")
+    elif verbose:
+        print(f"Using cached normal rows from {cache_path}")
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return np.load(cache_path, mmap_mode='r'), meta['columns']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the cached numeric matrix of the normal rows of a KDD file')
+    parser.add_argument('--data_path', required=True)
+    parser.add_argument('--cache_dir', default='cache')
+    parser.add_argument('--chunksize', type=int, default=200000)
+    args = parser.parse_args()
+
+    start = time.time()
+    matrix, matrix_columns = load_normal_numeric(args.data_path, args.cache_dir, args.chunksize)
+    print(f"{matrix.shape[0]} rows x {matrix.shape[1]} columns in {time.time() - start:.2f}s")
@@ -0,0 +1,116 @@
+import threading
+import time
+
+
+class LocalPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def xadd(self, name, fields, *args, **kwargs):
+        self.commands.append((name, fields, args, kwargs))
+        return self
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [self.client.xadd(name, fields, *args, **kwargs) for name, fields, args, kwargs in commands]
+
+    def reset(self):
+        self.commands = []
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the handful of Redis commands the capture and
+    scoring code uses (XADD, XLEN, XREAD, XRANGE, XINFO STREAM, GET/SET and pipelines), for
+    replays and benchmarks without a Redis server. Values are stored as
+    strings, as with decode_responses=True, except bytes values (packed
+    records), which are kept as they are.
+    """
+
+    def __init__(self):
+        self.streams = {}
+        # Entries ever added per stream, trimmed or not, as XINFO STREAM reports them
+        self.added = {}
+        self.values = {}
+        self.last_ms = 0
+        self.seq = 0
+        self.condition = threading.Condition()
+
+    def _next_id(self):
+        ms = int(time.time() * 1000)
+        if ms <= self.last_ms:
+            ms = self.last_ms
+            self.seq += 1
+        else:
+            self.seq = 0
+        self.last_ms = ms
+        return f"{ms}-{self.seq}"
+
+    def pipeline(self, transaction=False):
+        return LocalPipeline(self)
+
+    def xadd(self, name, fields, id='*', maxlen=None, approximate=True):
+        with self.condition:
+            entry_id = self._next_id() if id == '*' else id
+            stream = self.streams.setdefault(name, [])
+            stream.append((entry_id, {str(k): v if isinstance(v, bytes) else str(v) for k, v in fields.items()}))
+            self.added[name] = self.added.get(name, 0) + 1
+            if maxlen is not None and len(stream) > maxlen:
+                del stream[:len(stream) - maxlen]
+            self.condition.notify_all()
+        return entry_id
+
+    def set(self, name, value):
+        self.values[name] = value if isinstance(value, bytes) else str(value)
+        return True
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def xlen(self, name):
+        return len(self.streams.get(name, []))
+
+    def xinfo_stream(self, name):
+        return {'length': self.xlen(name), 'last-generated-id': self._last_id(name),
+                'entries-added': self.added.get(name, 0)}
+
+    def xrange(self, name, min='-', max='+', count=None):
+        entries = self.streams.get(name, [])
+        return entries[:count] if count else list(entries)
+
+    def _last_id(self, name):
+        entries = self.streams.get(name)
+        return entries[-1][0] if entries else '0-0'
+
+    def _after(self, name, last_id):
+        entries = self.streams.get(name, [])
+        key = tuple(int(part) for part in last_id.split('-')) if '-' in last_id else (int(last_id), 0)
+        # Entry ids are increasing, scan back from the end for the first unread one
+        start = len(entries)
+        while start > 0 and tuple(int(part) for part in entries[start - 1][0].split('-')) > key:
+            start -= 1
+        return entries[start:]
+
+    def xread(self, streams, count=None, block=None):
+        with self.condition:
+            if block is None:
+                deadline = None
+            else:
+                # BLOCK 0 waits forever
+                deadline = time.monotonic() + (block / 1000.0 if block else float('inf'))
+            # '$' means entries added after this call
+            streams = {name: self._last_id(name) if last_id == '$' else last_id
+                       for name, last_id in streams.items()}
+            while True:
+                response = []
+                for name, last_id in streams.items():
+                    entries = self._after(name, last_id)
+                    if entries:
+                        response.append([name, entries[:count] if count else entries])
+                if response or deadline is None:
+                    return response
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.condition.wait(min(remaining, 1.0))
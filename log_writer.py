@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+import redis
+from record_codec import record_field
+
+
+class BufferedLogWriter:
+    """
+    Appends feature rows to the text log and the Redis stream in batches.
+    The log file stays open and XADDs go through one pipeline, flushed
+    every flush_count records or flush_interval seconds, whichever is first.
+    Either output can be turned off by passing None. With an encoder (e.g.
+    RecordSchema.encode) stream entries carry one packed record instead of
+    one string field per feature; the text log is unchanged.
+    """
+
+    def __init__(self, log_path, redis_client, fields, stream='network_logs', maxlen=100000,
+                 flush_count=256, flush_interval=0.5, encoder=None):
+        self.log_path = log_path
+        self.redis_client = redis_client
+        self.fields = fields
+        self.stream = stream
+        self.maxlen = maxlen
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self.encoder = encoder
+        self.file = None
+        self.pipe = None
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.written = 0
+        self.failed = 0
+
+    def write(self, feature_dict):
+        if self.file is None and self.log_path is not None:
+            self.file = open(self.log_path, "a", buffering=1 << 16)
+        if self.pipe is None and self.redis_client is not None:
+            self.pipe = self.redis_client.pipeline(transaction=False)
+
+        if self.file is not None:
+            row = [str(feature_dict.get(feat, 0)) for feat in self.fields]
+            self.file.write(",".join(row) + "\n")
+        if self.pipe is not None:
+            # The cap leaves the consumer a backlog of maxlen records before anything is trimmed
+            entry = feature_dict if self.encoder is None else {record_field: self.encoder(feature_dict)}
+            self.pipe.xadd(self.stream, entry, maxlen=self.maxlen, approximate=True)
+        self.pending += 1
+
+        if self.pending >= self.flush_count:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, 0
+        if self.file is not None:
+            self.file.flush()
+        if self.pipe is None:
+            self.written += pending
+            return
+        try:
+            self.pipe.execute()
+            self.written += pending
+        except redis.RedisError as e:
+            # The rows are already in the text log, don't stall capture on Redis
+            self.pipe.reset()
+            self.failed += pending
+            print(f"Redis write failed, dropped {pending} records from the stream:", e)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BackgroundLogWriter:
+    """
+    Runs a BufferedLogWriter on its own thread behind a bounded queue, so
+    capture never waits on disk or Redis. Records are dropped (and counted)
+    if the queue is full.
+    """
+
+    _stop = object()
+
+    def __init__(self, writer, queue_size=100000):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def write(self, feature_dict):
+        try:
+            self.queue.put_nowait(feature_dict)
+        except queue.Full:
+            self.dropped += 1
+
+    def poll(self):
+        # Time-based flushing happens on the writer thread
+        pass
+
+    def _run(self):
+        writer = self.writer
+        while True:
+            try:
+                item = self.queue.get(timeout=writer.flush_interval)
+            except queue.Empty:
+                writer.poll()
+                continue
+            if item is self._stop:
+                break
+            writer.write(item)
+        writer.close()
+
+    def close(self):
+        self.queue.put(self._stop)
+        self.thread.join()
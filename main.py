@@ -1,23 +1,23 @@
 import argparse
 import pandas as pd
 import preprocess
-from sklearn import preprocessing
 import numpy as np
-import autoencoder
-from datetime import datetime
 from sklearn.model_selection import train_test_split
-from io import StringIO
 import os
 import joblib
 import json
-import redis
-from tensorflow.keras.models import load_model
-import tensorflow.keras.losses
-
-def predict_single_row(model, row, threshold):
-    row_values = np.array(row).reshape(1, -1)
-    prediction = model.predict(row_values)
-    reconstruction_error = np.mean(np.square(row_values - prediction), axis=1)
+import metrics
+import serve
+import kdd_loader
+from serve import model_path, scaler_path, threshold_path
+
+def predict_single_row(model, row, threshold, cache=None):
+    row_values = np.array(row, dtype=float).reshape(1, -1)
+    if cache is not None:
+        _, reconstruction_error = serve.predict_batch(model, row_values, threshold, cache)
+    else:
+        prediction = model.predict(row_values)
+        reconstruction_error = np.mean(np.square(row_values - prediction), axis=1)
 
     print(f"Reconstruction Error: {reconstruction_error}")
     print(f"Threshold: {threshold}")
@@ -28,6 +28,8 @@ def predict_single_row(model, row, threshold):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--data_path', default=r'C:\Users\PARAS AGARWAL\Desktop\HackByte\HackByte\DataFiles\KDD\kddcup.data_10_percent_corrected')
+    parser.add_argument('--cache_dir', default='cache', help='Where the parsed training matrix is cached')
+    parser.add_argument('--chunksize', type=int, default=200000, help='Rows per chunk when accumulating feature statistics')
     parser.add_argument('--epochs', type=int, default=300)
     parser.add_argument('--archi', default='U20,D,U15,D,U10,D,U15,D,U20')
     parser.add_argument('--regu', default='l1l2')
@@ -37,112 +39,114 @@ if __name__ == '__main__':
     parser.add_argument('--dropout', type=float, default=0.1)
     parser.add_argument('--model', default='autoencoder')
     parser.add_argument('--loss', default='mse')
+    parser.add_argument('--record_format', choices=['text', 'packed'], default='text',
+                        help='packed also accepts binary records from network_logger --record_format packed')
+    parser.add_argument('--batch_size', type=int, default=64, help='Max stream entries scored per forward pass')
+    parser.add_argument('--max_latency_ms', type=int, default=50, help='Max wait for a batch to fill once its first entry arrives')
+    parser.add_argument('--ring_path', default=serve.ring_path, help="Memory-mapped history of scored records, '' to turn it off")
+    parser.add_argument('--ring_capacity', type=int, default=100000)
+    parser.add_argument('--cache_size', type=int, default=65536, help='Reconstruction errors kept for repeated rows, 0 to turn the cache off')
+    parser.add_argument('--cache_quantum', type=float, default=0.0, help='Round scaled features to this step for cache keys, 0 for exact matches')
+    parser.add_argument('--metrics_port', type=int, default=0, help='Serve Prometheus metrics on this local port, 0 to turn it off')
+    parser.add_argument('--metrics_file', default=None, help='Also write the metrics to this file every few seconds')
+    parser.add_argument('--log_interval', type=float, default=10.0, help='Seconds between summary lines')
+    parser.add_argument('--recalibrate_interval', type=float, default=0.0,
+                        help='Seconds between threshold recalibrations from the scored errors, 0 to keep the saved threshold')
+    parser.add_argument('--threshold_quantile', type=float, default=0.999, help='Quantile of the reconstruction errors used as threshold')
+    parser.add_argument('--threshold_window', type=int, default=1000000, help='Rows after which older errors start to age out, 0 to keep all')
+    parser.add_argument('--threshold_min_count', type=int, default=1000, help='Rows needed before a threshold is recalibrated')
+    parser.add_argument('--threshold_group_by', default='', help="Comma separated fields with their own threshold, e.g. 'protocol_type,service'")
+    parser.add_argument('--threshold_max_change', type=float, default=2.0,
+                        help='Recalibrated thresholds stay within this factor of the trained threshold, 0 for no bound')
+    parser.add_argument('--finetune_interval', type=float, default=0.0,
+                        help='Seconds between background fine-tuning rounds on recent normal rows, 0 to turn it off')
+    parser.add_argument('--finetune_rows', type=int, default=100000, help='Size of the reservoir sample of normal rows')
+    parser.add_argument('--finetune_min_rows', type=int, default=10000, help='Sampled rows needed before fine-tuning')
+    parser.add_argument('--finetune_epochs', type=int, default=3)
+    parser.add_argument('--finetune_batch_size', type=int, default=1024)
+    parser.add_argument('--finetune_lr', type=float, default=1e-4)
+    parser.add_argument('--keep_scaler', action='store_true', help='Fine-tune with the loaded scaler instead of refitting it on the sample')
+    parser.add_argument('--finetune_save', action='store_true', help='Overwrite the saved artifacts with every fine-tuned version')
     args = parser.parse_args()
 
-    num_columns = 42
-    columns = [f'col{i}' for i in range(num_columns)]
-    df = pd.read_csv(args.data_path, header=None, names=columns)
-
-    df = df[df['col41'].str.strip().str.lower().str.startswith('normal')]
-    df_numeric = df.drop(columns=['col0', 'col1', 'col2', 'col3', 'col41']).astype(float)
-
-    df_numeric, dropped_cols = preprocess.dataframe_drop_correlated_columns(
-        df_numeric, threshold=args.correlation_value, verbose=True)
-    print("Dropped columns due to high correlation:", dropped_cols)
-
-    standard_scaler = preprocessing.StandardScaler()
-    x_scaled = standard_scaler.fit_transform(df_numeric.values)
-    df_processed = pd.DataFrame(x_scaled, columns=df_numeric.columns)
-
-    train_X, valid_X = train_test_split(df_processed, test_size=0.25, random_state=1)
-
-    model_path = 'saved_model.h5'
-    scaler_path = 'scaler.pkl'
-    threshold_path = 'threshold.json'
-
-    if os.path.exists(model_path) and os.path.exists(scaler_path) and os.path.exists(threshold_path):
-        print("Loading saved model, scaler, and threshold...")
-
-        custom_objects = {'mse': tensorflow.keras.losses.MeanSquaredError()}
-        wrapper_model = load_model(model_path, custom_objects=custom_objects, compile=False)
-        wrapper_model.compile(optimizer='adam', loss='mse')
-
-        standard_scaler = joblib.load(scaler_path)
-        with open(threshold_path) as f:
-            threshold = json.load(f)['threshold']
+    if serve.artifacts_exist():
+        # Fast start: the feature schema is saved with the model, skip the training set entirely
+        print("Loading saved model, scaler, threshold and feature schema...")
+        wrapper_model, standard_scaler, threshold, feature_columns = serve.load_artifacts()
 
     else:
-        print("Training new model...")
-        wrapper = autoencoder.Autoencoder(
-            num_features=len(df_processed.columns),
-            archi=args.archi,
-            reg=args.regu,
-            l1_value=args.l1_value,
-            l2_value=args.l2_value,
-            dropout=args.dropout,
-            loss=args.loss
-        )
-        wrapper.train(train_X, valid_X, epochs=args.epochs, batch_size=1024)
-
-        normal_predictions = wrapper.model.predict(train_X)
-        reconstruction_errors = np.mean(np.square(train_X - normal_predictions), axis=1)
-        threshold = np.mean(reconstruction_errors) + 3 * np.std(reconstruction_errors)
-
-        wrapper.model.save(model_path)
-        joblib.dump(standard_scaler, scaler_path)
-        with open(threshold_path, 'w') as f:
-            json.dump({'threshold': threshold}, f)
-
-        wrapper_model = wrapper.model
+        # Normal rows only, parsed in typed chunks and cached as a memory-mapped .npy
+        x_normal, numeric_columns = kdd_loader.load_normal_numeric(args.data_path, args.cache_dir, args.chunksize)
+
+        # One pass over the rows for the correlations and the scaler, in O(features^2) memory
+        stats = preprocess.StreamingStats.from_chunks(
+            (x_normal[start:start + args.chunksize] for start in range(0, len(x_normal), args.chunksize)),
+            numeric_columns)
+        dropped_cols = stats.correlated_columns(threshold=args.correlation_value, verbose=True)
+        print("Dropped columns due to high correlation:", dropped_cols)
+        feature_columns = [col for col in numeric_columns if col not in dropped_cols]
+
+        standard_scaler = stats.standard_scaler(feature_columns)
+        feature_index = [numeric_columns.index(col) for col in feature_columns]
+        x_scaled = standard_scaler.transform(x_normal[:, feature_index])
+        df_processed = pd.DataFrame(x_scaled, columns=feature_columns)
+
+        train_X, valid_X = train_test_split(df_processed, test_size=0.25, random_state=1)
+
+        if os.path.exists(model_path) and os.path.exists(scaler_path) and os.path.exists(threshold_path):
+            print("Loading saved model, scaler, and threshold...")
+            serve.save_feature_schema(feature_columns, dropped_cols)
+            wrapper_model, standard_scaler, threshold, feature_columns = serve.load_artifacts()
+
+        else:
+            import autoencoder
+            import numpy_model
+
+            print("Training new model...")
+            wrapper = autoencoder.Autoencoder(
+                num_features=len(df_processed.columns),
+                archi=args.archi,
+                reg=args.regu,
+                l1_value=args.l1_value,
+                l2_value=args.l2_value,
+                dropout=args.dropout,
+                loss=args.loss
+            )
+            wrapper.train(train_X, valid_X, epochs=args.epochs, batch_size=1024)
+
+            normal_predictions = wrapper.model.predict(train_X)
+            reconstruction_errors = np.mean(np.square(train_X - normal_predictions), axis=1)
+            threshold = np.mean(reconstruction_errors) + 3 * np.std(reconstruction_errors)
+
+            wrapper.model.save(model_path)
+            numpy_model.export_weights(wrapper.model)
+            joblib.dump(standard_scaler, scaler_path)
+            with open(threshold_path, 'w') as f:
+                json.dump({'threshold': threshold}, f)
+            serve.save_feature_schema(feature_columns, dropped_cols)
+
+            wrapper_model = wrapper.model
 
     # ----------- REDIS STREAM LOGIC STARTS HERE -----------
-   # ----------- REDIS STREAM LOGIC STARTS HERE -----------
-    # ----------- REDIS STREAM LOGIC STARTS HERE -----------
-    print("Listening to Redis stream...")
-
-    r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-    last_id = '$'
-    # KDD features (same order used when writing to Redis)
-    all_fields = [
-        "duration", "protocol_type", "service", "flag", "src_bytes", "dst_bytes", "land", "wrong_fragment",
-        "urgent", "hot", "num_failed_logins", "logged_in", "num_compromised", "root_shell",
-        "su_attempted", "num_root", "num_file_creations", "num_shells", "num_access_files",
-        "num_outbound_cmds", "is_host_login", "is_guest_login", "count", "srv_count", "serror_rate",
-        "srv_serror_rate", "rerror_rate", "srv_rerror_rate", "same_srv_rate", "diff_srv_rate",
-        "srv_diff_host_rate", "dst_host_count", "dst_host_srv_count", "dst_host_same_srv_rate",
-        "dst_host_diff_srv_rate", "dst_host_same_src_port_rate", "dst_host_srv_diff_host_rate",
-        "dst_host_serror_rate", "dst_host_srv_serror_rate", "dst_host_rerror_rate",
-        "dst_host_srv_rerror_rate"
-    ]
-
-
-    while True:
-        response = r.xread({'network_logs': last_id}, count=1, block=1)
-        for stream, messages in response:
-            for entry_id, data in messages:
-                last_id = entry_id
-
-                line = ','.join([data.get(feat, '0') for feat in all_fields])
-                print(line);
-                log_df = pd.read_csv(StringIO(line), header=None, names=columns)
-                log_df_numeric = log_df.drop(columns=['col0', 'col1', 'col2', 'col3', 'col41'])
-                log_df_numeric = log_df_numeric.apply(pd.to_numeric, errors='coerce').fillna(0)
-
-                log_df_numeric = log_df_numeric[df_numeric.columns]
-                log_scaled = standard_scaler.transform(log_df_numeric.values)
-                log_row = log_scaled[0].tolist()
-
-                result = predict_single_row(wrapper_model, log_row, threshold)
-
-                # Save in format: label, full_log_string
-                # Efficient overwrite: keeps only the latest log entry
-                with open("classified_results.txt", "w") as output_file:
-                    output_file.write(f"{result}, {line}\n")
-
-
-# ----------- REDIS STREAM LOGIC ENDS HERE -----------
-
-
-# ----------- REDIS STREAM LOGIC ENDS HERE -----------
-
+    r = serve.redis_client(record_format=args.record_format)
+    ring = serve.open_ring(args.ring_path, feature_columns, args.ring_capacity)
+    cache = serve.open_cache(args.cache_size, args.cache_quantum)
+    calibrator = serve.open_calibrator(threshold, args.recalibrate_interval, args.threshold_quantile,
+                                       args.threshold_window, args.threshold_min_count, args.threshold_group_by,
+                                       max_change=args.threshold_max_change)
+    tuner = serve.open_tuner(args.finetune_interval, wrapper_model, wrapper_model, standard_scaler, threshold,
+                             feature_columns, capacity=args.finetune_rows, min_rows=args.finetune_min_rows,
+                             epochs=args.finetune_epochs, batch_size=args.finetune_batch_size,
+                             learning_rate=args.finetune_lr, refit_scaler=not args.keep_scaler,
+                             save=args.finetune_save, loss=args.loss)
+    registry = metrics.Registry()
+    exporter = metrics.Exporter(registry, args.metrics_port, args.metrics_file)
+    try:
+        serve.consume(r, wrapper_model, standard_scaler, threshold, feature_columns,
+                      args.batch_size, args.max_latency_ms, ring, cache, serve.record_decoder(r, args.record_format),
+                      registry, exporter, args.log_interval, calibrator=calibrator, tuner=tuner)
+    finally:
+        # Releases the single-writer lock of the ring where there is no fcntl
+        if ring is not None:
+            ring.close()
     # ----------- REDIS STREAM LOGIC ENDS HERE -----------
@@ -0,0 +1,206 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, from 50us to 10s
+default_buckets = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name):
+        yield f'{name}_total{_format_labels(self.labels)} {_format_value(self.value)}'
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, labels=()):
+        self.labels = labels
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name):
+        yield f'{name}{_format_labels(self.labels)} {_format_value(self.value)}'
+
+
+class Histogram:
+    """Fixed upper bounds; observe() is a bisect and two additions."""
+
+    kind = 'histogram'
+
+    def __init__(self, labels=(), buckets=default_buckets):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{_format_labels(self.labels, [("le", _format_value(bound))])} {cumulative}'
+        yield f'{name}_sum{_format_labels(self.labels)} {_format_value(self.sum)}'
+        yield f'{name}_count{_format_labels(self.labels)} {self.count}'
+
+
+class Registry:
+    """
+    Named metrics, one instance per label set, rendered in the Prometheus
+    text exposition format. Updates are plain attribute writes without
+    locks; a scrape may see a histogram mid-update, which is fine for
+    monitoring.
+    """
+
+    def __init__(self, prefix='hackbyte_'):
+        self.prefix = prefix
+        self.families = {}
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = (cls, help_text, {})
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = cls(key, **kwargs)
+        return metric
+
+    def counter(self, name, help_text='', **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', **labels):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', buckets=default_buckets, **labels):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for name, (cls, help_text, members) in list(self.families.items()):
+            full_name = self.prefix + name
+            if help_text:
+                lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {cls.kind}')
+            for metric in list(members.values()):
+                lines.extend(metric.samples(full_name))
+        return '\n'.join(lines) + '\n'
+
+    def write_file(self, path):
+        # Written to a temporary file first, so a collector never reads half a scrape
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def serve_http(registry, port, host='127.0.0.1'):
+    """Serve registry.render() at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+class Exporter:
+    """Starts the HTTP endpoint if a port is given and rewrites the metrics file every `interval` seconds."""
+
+    def __init__(self, registry, port=0, path=None, interval=5.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.last_write = 0.0
+        self.server = serve_http(registry, port) if port else None
+
+    def poll(self):
+        if self.path and time.monotonic() - self.last_write >= self.interval:
+            self.last_write = time.monotonic()
+            self.registry.write_file(self.path)
+
+    def close(self):
+        if self.path:
+            self.registry.write_file(self.path)
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class SampledLogger:
+    """Prints at most one message per interval and says how many were skipped in between."""
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self.last = None
+        self.skipped = 0
+
+    def ready(self):
+        now = time.monotonic()
+        if self.last is None or now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
+
+    def log(self, message):
+        if not self.ready():
+            self.skipped += 1
+            return
+        if self.skipped:
+            message += f" ({self.skipped} similar messages skipped)"
+            self.skipped = 0
+        print(message)
+
+
+def stream_lag_ms(last_id, head_id):
+    """How far a consumer is behind the stream head, from the millisecond part of the entry ids."""
+    if not last_id or not head_id or last_id == '$':
+        return 0
+    if isinstance(last_id, bytes):
+        last_id = last_id.decode()
+    if isinstance(head_id, bytes):
+        head_id = head_id.decode()
+    return max(0, int(head_id.split('-')[0]) - int(last_id.split('-')[0]))
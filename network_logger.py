@@ -1,15 +1,21 @@
-import pyshark
+import argparse
 import time
 import redis
-from collections import deque
+import metrics
+from flow_table import FlowTable, PacketInfo
+from log_writer import BufferedLogWriter, BackgroundLogWriter
+from record_codec import RecordSchema, register_schema
+from window_stats import TimeWindowStats, HostWindowStats, connection_errors
 
 # Redis connection setup
 r = redis.Redis(host='localhost', port=6379, decode_responses=True)
 
 log_file = "pyshark_network_log.txt"
-seen_streams = {}
 history_window = 2  # seconds
-recent_connections = deque()  # stores (timestamp, src, dst, dport, flags)
+host_history = 100  # connections
+time_window_stats = TimeWindowStats(history_window)
+host_window_stats = HostWindowStats(host_history)
+flow_table = FlowTable()
 
 # Full KDD feature list without label
 all_fields = [
@@ -24,112 +30,199 @@ all_fields = [
     "dst_host_srv_rerror_rate"
 ]
 
-print("Starting real-time packet capture using PyShark...")
-
+# Hardcoded values for non-computable features
+hardcoded_defaults = {
+    "hot": 0, "num_failed_logins": 0, "logged_in": 1, "num_compromised": 0,
+    "root_shell": 0, "su_attempted": 0, "num_root": 0, "num_file_creations": 0,
+    "num_shells": 0, "num_access_files": 0, "num_outbound_cmds": 0, "is_host_login": 0,
+    "is_guest_login": 0, "same_srv_rate": 1.0, "diff_srv_rate": 0.0, "srv_diff_host_rate": 0.0
+}
+
+log_writer = BufferedLogWriter(log_file, r, all_fields)
+metrics_registry = metrics.Registry()
+packet_errors = metrics_registry.counter('capture_packet_errors', 'Packets that failed feature extraction')
+error_log = metrics.SampledLogger(10.0)
+
+
+def packet_info(pkt):
+    if 'IP' not in pkt or pkt.transport_layer is None:
+        return None
+
+    ip = pkt.ip
+    protocol = pkt.transport_layer.lower()
+    if not hasattr(pkt, protocol):
+        return None
+
+    trans_layer = getattr(pkt, protocol)
+    srcport = getattr(trans_layer, 'srcport', None)
+    dstport = getattr(trans_layer, 'dstport', None)
+    if not srcport or not dstport:
+        return None
+
+    return PacketInfo(
+        # Capture time rather than processing time, so replays see the original timing
+        timestamp=float(pkt.sniff_timestamp),
+        src=ip.src,
+        dst=ip.dst,
+        protocol="tcp" if 'TCP' in pkt else "udp",
+        sport=int(srcport),
+        dport=int(dstport),
+        length=int(pkt.length),
+        frag_offset=int(getattr(ip, 'frag_offset', '0')),
+        flags=int(pkt.tcp.flags, 16) if 'TCP' in pkt else 0,
+    )
+
+def flow_features(flow, reported=None):
+    # reported: when the connection enters the time window, by default its last packet
+    features = {}
+    flag = flow.kdd_flag()
+    features["duration"] = round(flow.duration, 3)
+    features["protocol_type"] = flow.protocol
+    features["service"] = "http"  # hardcoded example
+    features["flag"] = flag
+    features["src_bytes"] = flow.src_bytes
+    features["dst_bytes"] = flow.dst_bytes
+    features["land"] = int(flow.src == flow.dst and flow.sport == flow.dport)
+    features["wrong_fragment"] = flow.wrong_fragment
+    features["urgent"] = flow.urgent
+
+    # Add to history, the window counters are updated incrementally
+    serror, rerror = connection_errors(flag)
+    time_window_stats.add(flow.last_seen if reported is None else reported, flow.dst, flow.dport, serror, rerror)
+    host_window_stats.add(flow.dst, flow.dport, flow.sport, serror, rerror)
+    features.update(time_window_stats.features(flow.dst, flow.dport))
+    features.update(host_window_stats.features(flow.dst, flow.dport, flow.sport))
+
+    features.update(hardcoded_defaults)
+    return features
 
 def extract_features(pkt):
+    """
+    Account one packet (a pyshark packet or an already decoded PacketInfo)
+    in the flow table. Returns the KDD features of the connection this
+    packet closed, or an empty dict while it is still open.
+    """
     features = {}
-    now = time.time()
 
     try:
-        if 'IP' not in pkt or pkt.transport_layer is None:
-            return features
-
-        ip = pkt.ip
-        src = ip.src
-        dst = ip.dst
-        protocol = pkt.transport_layer.lower()
-
-        if not hasattr(pkt, protocol):
-            return features
-
-        trans_layer = getattr(pkt, protocol)
-        srcport = getattr(trans_layer, 'srcport', None)
-        dstport = getattr(trans_layer, 'dstport', None)
-        if not srcport or not dstport:
+        info = pkt if isinstance(pkt, PacketInfo) else packet_info(pkt)
+        if info is None:
             return features
 
-        flags = pkt.tcp.flags if 'TCP' in pkt else ''
-        conn_key = (src, dst)
-
-        if conn_key not in seen_streams:
-            seen_streams[conn_key] = {"start_time": now}
-        duration = round(now - seen_streams[conn_key]["start_time"], 3)
-        features["duration"] = duration
-        features["protocol_type"] = "tcp" if 'TCP' in pkt else "udp"
-        features["service"] = "http"  # hardcoded example
-        features["flag"] = "SF"  # hardcoded example
-        features["src_bytes"] = int(pkt.length) if ip.src == src else 0
-        features["dst_bytes"] = int(pkt.length) if ip.src == dst else 0
-        features["land"] = int(src == dst and srcport == dstport)
-        features["wrong_fragment"] = int(getattr(pkt.ip, 'frag_offset', '0') != '0')
-        features["urgent"] = int(pkt.tcp.flags_urg == '1') if 'TCP' in pkt else 0
-
-        # Add to history
-        recent_connections.append((now, src, dst, dstport, flags))
-        while recent_connections and now - recent_connections[0][0] > history_window:
-            recent_connections.popleft()
-
-        same_host = 0
-        same_service = 0
-        syn_error = 0
-        syn_total = 0
-
-        for ts, h_src, h_dst, h_dport, h_flags in recent_connections:
-            if h_dst == dst:
-                same_host += 1
-                if h_dport == dstport:
-                    same_service += 1
-                if '0x00000002' in h_flags:
-                    syn_total += 1
-                    if '0x00000004' in h_flags:
-                        syn_error += 1
-
-        features["count"] = same_host
-        features["srv_count"] = same_service
-        features["serror_rate"] = round(syn_error / syn_total, 2) if syn_total else 0
-        features["srv_serror_rate"] = round(syn_error / same_service, 2) if same_service else 0
-
-        # Hardcoded values for non-computable features
-        hardcoded_defaults = {
-            "hot": 0, "num_failed_logins": 0, "logged_in": 1, "num_compromised": 0,
-            "root_shell": 0, "su_attempted": 0, "num_root": 0, "num_file_creations": 0,
-            "num_shells": 0, "num_access_files": 0, "num_outbound_cmds": 0, "is_host_login": 0,
-            "is_guest_login": 0, "rerror_rate": 0.0, "srv_rerror_rate": 0.0, "same_srv_rate": 1.0,
-            "diff_srv_rate": 0.0, "srv_diff_host_rate": 0.0, "dst_host_count": 10, "dst_host_srv_count": 10,
-            "dst_host_same_srv_rate": 1.0, "dst_host_diff_srv_rate": 0.0, "dst_host_same_src_port_rate": 0.1,
-            "dst_host_srv_diff_host_rate": 0.0, "dst_host_serror_rate": 0.0, "dst_host_srv_serror_rate": 0.0,
-            "dst_host_rerror_rate": 0.0, "dst_host_srv_rerror_rate": 0.0
-        }
-
-        for key, val in hardcoded_defaults.items():
-            features[key] = val
+        flow = flow_table.update(info)
+        if flow is not None:
+            features = flow_features(flow)
 
     except Exception as e:
-        print("Error:", e)
+        packet_errors.inc()
+        error_log.log(f"Error: {e}")
 
     return features
 
-
-def write_log(feature_dict):
-    # Write to text log
-    row = [str(feature_dict.get(feat, 0)) for feat in all_fields]
-    with open(log_file, "a") as f:
-        f.write(",".join(row) + "\n")
-
-    # Write to Redis stream with maxlen cap
-    r.xadd("network_logs", feature_dict, maxlen=1, approximate=True)
+def flush_flows(now):
+    # Connections that went idle or were evicted never see a closing packet. They enter the time window
+    # when they went idle, their last_seen is an idle timeout older than the window (e.g. SYN floods)
+    idle_timeout = flow_table.idle_timeout
+    return [flow_features(flow, min(now, flow.last_seen + idle_timeout)) for flow in flow_table.expire(now)]
 
 
-# Start live capture
-capture = pyshark.LiveCapture(interface='Wi-Fi')
-last_time = 0
-
-for packet in capture.sniff_continuously():
-    now = time.time()
-    if now - last_time >= 0.5:  # 500ms = 0.5 seconds
-        feats = extract_features(packet)
-        if feats:
-            write_log(feats)
-        last_time = now
+def write_log(feature_dict):
+    # Buffered write to the text log and the Redis stream
+    log_writer.write(feature_dict)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interface', default='Wi-Fi')
+    parser.add_argument('--backend', choices=['pyshark', 'raw'], default='pyshark',
+                        help='raw decodes headers from a Linux packet socket with pcap_decoder instead of tshark')
+    parser.add_argument('--idle_timeout', type=float, default=15, help='Seconds without packets before a flow is reported')
+    parser.add_argument('--active_timeout', type=float, default=120, help='Long-lived flows are reported every this many seconds')
+    parser.add_argument('--max_flow_mb', type=float, default=64, help='Memory cap for the flow table, oldest flows are evicted')
+    parser.add_argument('--stream_maxlen', type=int, default=100000,
+                        help='Approximate cap on network_logs, the backlog the consumer may fall behind by')
+    parser.add_argument('--record_format', choices=['text', 'packed'], default='text',
+                        help='packed writes one binary record per stream entry, consumers need --record_format packed')
+    parser.add_argument('--flush_count', type=int, default=256, help='Records per pipelined XADD batch')
+    parser.add_argument('--flush_interval', type=float, default=0.5, help='Max seconds a record waits in the buffer')
+    parser.add_argument('--background_writer', action='store_true', help='Write on a separate thread so capture never blocks')
+    parser.add_argument('--stats_interval', type=float, default=30, help='Seconds between flow table reports')
+    parser.add_argument('--metrics_port', type=int, default=0, help='Serve Prometheus metrics on this local port, 0 to turn it off')
+    parser.add_argument('--metrics_file', default=None, help='Also write the metrics to this file every few seconds')
+    args = parser.parse_args()
+
+    flow_table = FlowTable(args.idle_timeout, args.active_timeout, int(args.max_flow_mb * 1024 * 1024))
+    encoder = None
+    if args.record_format == 'packed':
+        schema = RecordSchema(all_fields)
+        register_schema(r, schema)
+        encoder = schema.encode
+    log_writer = BufferedLogWriter(log_file, r, all_fields, maxlen=args.stream_maxlen,
+                                   flush_count=args.flush_count, flush_interval=args.flush_interval, encoder=encoder)
+    if args.background_writer:
+        log_writer = BackgroundLogWriter(log_writer)
+
+    # Start live capture
+    if args.backend == 'raw':
+        import pcap_decoder
+        print("Starting real-time packet capture on a raw socket...")
+        packets = pcap_decoder.sniff_raw(args.interface)
+    else:
+        import pyshark
+        print("Starting real-time packet capture using PyShark...")
+        packets = pyshark.LiveCapture(interface=args.interface).sniff_continuously()
+    exporter = metrics.Exporter(metrics_registry, args.metrics_port, args.metrics_file)
+    stage_help = 'Seconds per packet or per expiry pass spent in each capture stage'
+    read_time, extract_time, write_time, expire_time = (
+        metrics_registry.histogram('capture_stage_seconds', stage_help, stage=stage)
+        for stage in ('read', 'extract', 'write', 'expire'))
+    packets_seen = metrics_registry.counter('capture_packets', 'Packets read from the capture')
+    records_written = metrics_registry.counter('capture_records', 'Connection records written')
+    active_flows = metrics_registry.gauge('capture_active_flows', 'Connections in the flow table')
+    writer_pending = metrics_registry.gauge('capture_writer_pending', 'Records buffered for the next flush')
+    writer_queue = metrics_registry.gauge('capture_writer_queue', 'Records waiting for the background writer')
+    writer_dropped = metrics_registry.gauge('capture_writer_dropped', 'Records dropped by a full writer queue')
+
+    last_expire = time.time()
+    last_stats = last_expire
 
+    try:
+        t0 = time.perf_counter()
+        for packet in packets:
+            t1 = time.perf_counter()
+            feats = extract_features(packet)
+            t2 = time.perf_counter()
+            if feats:
+                write_log(feats)
+                records_written.inc()
+            t3 = time.perf_counter()
+            read_time.observe(t1 - t0)
+            extract_time.observe(t2 - t1)
+            write_time.observe(t3 - t2)
+            packets_seen.inc()
+
+            now = time.time()
+            if now - last_expire >= 1:
+                expired = flush_flows(now)
+                for feats in expired:
+                    write_log(feats)
+                records_written.inc(len(expired))
+                log_writer.poll()
+                last_expire = now
+                expire_time.observe(time.perf_counter() - t3)
+
+                active_flows.set(len(flow_table))
+                if isinstance(log_writer, BackgroundLogWriter):
+                    writer_queue.set(log_writer.queue.qsize())
+                    writer_dropped.set(log_writer.dropped)
+                    writer_pending.set(log_writer.writer.pending)
+                else:
+                    writer_pending.set(log_writer.pending)
+                exporter.poll()
+            if now - last_stats >= args.stats_interval:
+                print("Flow table:", flow_table.stats())
+                last_stats = now
+            t0 = time.perf_counter()
+    finally:
+        log_writer.close()
+        exporter.close()
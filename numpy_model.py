@@ -0,0 +1,142 @@
+import argparse
+import time
+import numpy as np
+
+weights_path = 'model_weights.npz'
+
+activation_functions = {
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'linear': lambda x: x,
+}
+
+def dense_layers(model):
+    """
+    Kernels, biases and activations of the Dense layers of a trained
+    Autoencoder model. Input and Dropout layers do nothing at inference
+    time and are skipped.
+    """
+    kernels, biases, activations = [], [], []
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        activation = layer.get_config().get('activation', 'linear')
+        if len(weights) != 2 or activation not in activation_functions:
+            raise ValueError(f"Unsupported layer for export: {layer.name} ({activation})")
+        kernels.append(weights[0])
+        biases.append(weights[1])
+        activations.append(activation)
+    return kernels, biases, activations
+
+def export_weights(model, output_file=weights_path):
+    """Save the Dense layers of a trained Autoencoder model to a .npz file."""
+    kernels, biases, activations = dense_layers(model)
+    arrays = {}
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        arrays[f'kernel_{i}'] = kernel
+        arrays[f'bias_{i}'] = bias
+
+    np.savez(output_file, activations=np.array(activations), **arrays)
+    return output_file
+
+class NumpyAutoencoder:
+    def __init__(self, kernels, biases, activations, dtype=np.float64, batch_size=8192):
+        self.dtype = np.dtype(dtype)
+        self.kernels = [np.ascontiguousarray(k, dtype=self.dtype) for k in kernels]
+        self.biases = [np.asarray(b, dtype=self.dtype) for b in biases]
+        self.activations = [activation_functions[a] for a in activations]
+        self.batch_size = batch_size
+        self.num_features = self.kernels[0].shape[0]
+
+    @classmethod
+    def load(cls, weights_file=weights_path, dtype=np.float64, batch_size=8192):
+        with np.load(weights_file) as data:
+            activations = [str(a) for a in data['activations']]
+            kernels = [data[f'kernel_{i}'] for i in range(len(activations))]
+            biases = [data[f'bias_{i}'] for i in range(len(activations))]
+        return cls(kernels, biases, activations, dtype=dtype, batch_size=batch_size)
+
+    @classmethod
+    def from_keras(cls, model, dtype=np.float64, batch_size=8192):
+        return cls(*dense_layers(model), dtype=dtype, batch_size=batch_size)
+
+    def _forward(self, rows):
+        x = np.asarray(rows, dtype=self.dtype)
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            x = x @ kernel
+            x += bias
+            x = activation(x)
+        return x
+
+    def predict(self, rows):
+        rows = np.asarray(rows)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        # Large inputs are scored in slices so the activations stay in cache-sized blocks
+        if len(rows) <= self.batch_size:
+            return self._forward(rows)
+        return np.concatenate([self._forward(rows[i:i + self.batch_size])
+                               for i in range(0, len(rows), self.batch_size)])
+
+    # Same call the Keras model exposes, so it drops into serve.predict_batch
+    predict_on_batch = predict
+
+    def reconstruction_error(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        return np.mean(np.square(rows - self.predict(rows)), axis=1)
+
+def _time_call(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+def check_parity(model, engine, rows, threshold):
+    keras_errors = np.mean(np.square(rows - model.predict(rows, verbose=0)), axis=1)
+    numpy_errors = engine.reconstruction_error(rows)
+    max_diff = np.max(np.abs(keras_errors - numpy_errors))
+    agreement = np.mean((keras_errors >= threshold) == (numpy_errors >= threshold))
+    print(f"[{engine.dtype}] max reconstruction error difference: {max_diff:.3e}, "
+          f"verdict agreement: {agreement * 100:.2f}%")
+    return max_diff, agreement
+
+def compare_latency(model, engines, rows, repeats=50):
+    single = rows[:1]
+    print(f"{'engine':<20}{'1 row (ms)':>14}{f'{len(rows)} rows (ms)':>18}{'rows/sec':>14}")
+    timings = [('keras predict', lambda x: model.predict(x, verbose=0)),
+               ('keras on_batch', model.predict_on_batch)]
+    timings += [(f'numpy {engine.dtype}', engine.predict) for engine in engines]
+    for name, fn in timings:
+        one = _time_call(lambda: fn(single), repeats)
+        batch = _time_call(lambda: fn(rows), max(1, repeats // 5))
+        print(f"{name:<20}{one * 1000:>14.3f}{batch * 1000:>18.3f}{len(rows) / batch:>14.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export saved_model.h5 to a NumPy scorer and check it against Keras')
+    parser.add_argument('--model_path', default='saved_model.h5')
+    parser.add_argument('--output', default=weights_path)
+    parser.add_argument('--threshold_path', default='threshold.json')
+    parser.add_argument('--check', action='store_true', help='Compare reconstruction errors and latency with the Keras model')
+    parser.add_argument('--rows', type=int, default=4096, help='Random scaled rows used by --check')
+    args = parser.parse_args()
+
+    import json
+    from tensorflow.keras.models import load_model
+
+    model = load_model(args.model_path, compile=False)
+    export_weights(model, args.output)
+    print(f"Exported {args.model_path} to {args.output}")
+
+    if args.check:
+        with open(args.threshold_path) as f:
+            threshold = json.load(f)['threshold']
+        engines = [NumpyAutoencoder.load(args.output, dtype=np.float64),
+                   NumpyAutoencoder.load(args.output, dtype=np.float32)]
+        rows = np.random.default_rng(0).standard_normal((args.rows, engines[0].num_features)) * 3
+        for engine in engines:
+            check_parity(model, engine, rows, threshold)
+        compare_latency(model, engines, rows)
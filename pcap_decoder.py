@@ -0,0 +1,218 @@
+import argparse
+import mmap
+import socket
+import struct
+import time
+from flow_table import PacketInfo
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+ETH_P_ALL = 0x0003
+
+_ethertype = struct.Struct('!H')
+_ipv4 = struct.Struct('!BxHHHxBxxII')  # version/ihl, total length, id, flags/fragment, protocol, src, dst
+_tcp = struct.Struct('!HH8xH')  # ports, data offset/flags
+_udp = struct.Struct('!HH')
+_pcap_magic = struct.Struct('<I')
+
+
+class PacketDecoder:
+    """
+    Decodes Ethernet / IPv4 / TCP / UDP headers straight from a buffer with
+    precompiled structs. With reuse=True one PacketInfo is updated in place
+    for every packet, so callers that keep packets must copy them. Later
+    fragments of a datagram carry no ports; they get the ports of its first
+    fragment, so they count against the same flow.
+    """
+
+    def __init__(self, linktype=LINKTYPE_ETHERNET, reuse=True, address_cache_size=65536, fragment_cache_size=4096):
+        self.linktype = linktype
+        self.reuse = reuse
+        self.info = PacketInfo()
+        self.addresses = {}
+        self.address_cache_size = address_cache_size
+        # (src, dst, protocol, ip id) -> (sport, dport) of datagrams with fragments still to come
+        self.fragments = {}
+        self.fragment_cache_size = fragment_cache_size
+
+    def _address(self, value):
+        address = self.addresses.get(value)
+        if address is None:
+            if len(self.addresses) >= self.address_cache_size:
+                self.addresses.clear()
+            address = socket.inet_ntoa(value.to_bytes(4, 'big'))
+            self.addresses[value] = address
+        return address
+
+    def decode(self, buf, offset, caplen, timestamp, wire_len):
+        end = offset + caplen
+        linktype = self.linktype
+        if linktype == LINKTYPE_ETHERNET:
+            if caplen < 14:
+                return None
+            ethertype, = _ethertype.unpack_from(buf, offset + 12)
+            offset += 14
+            while ethertype in ETHERTYPE_VLAN and offset + 4 <= end:
+                ethertype, = _ethertype.unpack_from(buf, offset + 2)
+                offset += 4
+            if ethertype != ETHERTYPE_IPV4:
+                return None
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if caplen < 16:
+                return None
+            ethertype, = _ethertype.unpack_from(buf, offset + 14)
+            if ethertype != ETHERTYPE_IPV4:
+                return None
+            offset += 16
+        elif linktype not in (LINKTYPE_RAW, LINKTYPE_IPV4):
+            return None
+
+        if end - offset < 20:
+            return None
+        version_ihl, total_length, ident, flags_fragment, protocol, src, dst = _ipv4.unpack_from(buf, offset)
+        if version_ihl >> 4 != 4 or protocol not in (6, 17):
+            return None
+        frag_offset = flags_fragment & 0x1fff
+        more_fragments = flags_fragment & 0x2000
+        offset += (version_ihl & 0x0f) * 4
+        protocol_name = 'tcp' if protocol == 6 else 'udp'
+
+        if frag_offset:
+            # Only the first fragment carries the ports, unknown if it was not seen
+            key = (src, dst, protocol, ident)
+            ports = self.fragments.get(key) if more_fragments else self.fragments.pop(key, None)
+            if ports is None:
+                return None
+            sport, dport = ports
+            flags = 0
+        else:
+            if protocol == 6:
+                if end - offset < 14:
+                    return None
+                sport, dport, offset_flags = _tcp.unpack_from(buf, offset)
+                flags = offset_flags & 0x01ff
+            else:
+                if end - offset < 4:
+                    return None
+                sport, dport = _udp.unpack_from(buf, offset)
+                flags = 0
+            if not sport or not dport:
+                return None
+            if more_fragments:
+                if len(self.fragments) >= self.fragment_cache_size:
+                    self.fragments.clear()
+                self.fragments[(src, dst, protocol, ident)] = (sport, dport)
+
+        info = self.info if self.reuse else PacketInfo()
+        info.timestamp = timestamp
+        info.src = self._address(src)
+        info.dst = self._address(dst)
+        info.protocol = protocol_name
+        info.sport = sport
+        info.dport = dport
+        info.length = wire_len
+        info.frag_offset = frag_offset
+        info.flags = flags
+        return info
+
+
+def read_pcap(pcap_path, reuse=True):
+    """Yield a PacketInfo for every IPv4 TCP/UDP packet in a classic libpcap file."""
+    with open(pcap_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        buf = memoryview(data)
+        try:
+            magic, = _pcap_magic.unpack_from(buf, 0)
+            if magic in (0xa1b2c3d4, 0xa1b23c4d):
+                endian = '<'
+            elif magic in (0xd4c3b2a1, 0x4d3cb2a1):
+                endian = '>'
+                magic = int.from_bytes(magic.to_bytes(4, 'little'), 'big')
+            else:
+                raise ValueError(f"{pcap_path} is not a libpcap file (pcapng is not supported, convert it with editcap -F pcap)")
+            divisor = 1e9 if magic == 0xa1b23c4d else 1e6
+
+            linktype, = struct.unpack_from(endian + 'I', buf, 20)
+            record = struct.Struct(endian + 'IIII')
+            decoder = PacketDecoder(linktype & 0x0fffffff, reuse)
+            decode = decoder.decode
+
+            offset = 24
+            size = len(buf)
+            while offset + 16 <= size:
+                ts_sec, ts_frac, caplen, wire_len = record.unpack_from(buf, offset)
+                offset += 16
+                if offset + caplen > size:
+                    break
+                info = decode(buf, offset, caplen, ts_sec + ts_frac / divisor, wire_len)
+                offset += caplen
+                if info is not None:
+                    yield info
+        finally:
+            buf.release()
+
+def sniff_raw(interface, reuse=True, buffer_size=65536):
+    """Yield a PacketInfo for every IPv4 TCP/UDP packet on a Linux interface (needs root)."""
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.ntohs(ETH_P_ALL))
+    sock.bind((interface, 0))
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    decoder = PacketDecoder(LINKTYPE_ETHERNET, reuse)
+    try:
+        while True:
+            length = sock.recv_into(view)
+            info = decoder.decode(buf, 0, length, time.time(), length)
+            if info is not None:
+                yield info
+    finally:
+        sock.close()
+
+def write_pcap(pcap_path, packets):
+    """Write PacketInfo records as minimal Ethernet/IPv4 frames, e.g. to build a benchmark capture."""
+    header = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET)
+    with open(pcap_path, 'wb') as f:
+        f.write(header)
+        for info in packets:
+            if info.protocol == 'tcp':
+                transport = struct.pack('!HHIIBBHHH', info.sport, info.dport, 0, 0, 0x50 | (info.flags >> 8),
+                                        info.flags & 0xff, 65535, 0, 0)
+                protocol = 6
+            else:
+                transport = struct.pack('!HHHH', info.sport, info.dport, 8, 0)
+                protocol = 17
+            ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(transport), 0, info.frag_offset, 64, protocol, 0,
+                             socket.inet_aton(info.src), socket.inet_aton(info.dst))
+            frame = b'\x00' * 12 + struct.pack('!H', ETHERTYPE_IPV4) + ip + transport
+            ts_sec = int(info.timestamp)
+            ts_usec = int(round((info.timestamp - ts_sec) * 1e6))
+            f.write(struct.pack('<IIII', ts_sec, ts_usec, len(frame), max(info.length, len(frame))))
+            f.write(frame)
+
+def benchmark(pcap_path, compare_pyshark=False):
+    start = time.perf_counter()
+    count = sum(1 for _ in read_pcap(pcap_path))
+    seconds = time.perf_counter() - start
+    print(f"struct:  {count} packets in {seconds:.3f}s, {seconds / max(count, 1) * 1e6:.2f} us/packet")
+
+    if compare_pyshark:
+        import pyshark
+        import network_logger
+        capture = pyshark.FileCapture(pcap_path, keep_packets=False)
+        start = time.perf_counter()
+        count = sum(1 for pkt in capture if network_logger.packet_info(pkt) is not None)
+        seconds = time.perf_counter() - start
+        capture.close()
+        print(f"pyshark: {count} packets in {seconds:.3f}s, {seconds / max(count, 1) * 1e6:.2f} us/packet")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure per-packet decode cost of the struct decoder')
+    parser.add_argument('pcap_path')
+    parser.add_argument('--compare_pyshark', action='store_true', help='Also decode the file with pyshark/tshark')
+    args = parser.parse_args()
+
+    benchmark(args.pcap_path, args.compare_pyshark)
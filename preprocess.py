@@ -1,7 +1,4 @@
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-import scipy.stats as stats
 import pandas as pd
 
 def dataframe_drop_correlated_columns(df, threshold=0.95, verbose=False):
@@ -24,6 +21,92 @@ def dataframe_drop_correlated_columns(df, threshold=0.95, verbose=False):
 
     return df, to_drop
 
+class StreamingStats:
+    """
+    Count, means and co-moment matrix of a stream of row chunks, merged with
+    the pairwise update of Chan, Golub and LeVeque so the result does not
+    depend on how the rows were chunked. Memory is O(features^2), independent
+    of the number of rows.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        num_features = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(num_features)
+        self.comoment = np.zeros((num_features, num_features))
+
+    @classmethod
+    def from_chunks(cls, chunks, columns):
+        stats = cls(columns)
+        for chunk in chunks:
+            stats.update(chunk)
+        return stats
+
+    def _merge(self, count, mean, comoment):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.comoment += comoment + np.outer(delta, delta) * (self.count * count / total)
+        self.mean += delta * (count / total)
+        self.count = total
+
+    def update(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if len(chunk) == 0:
+            return
+        chunk_mean = chunk.mean(axis=0)
+        centered = chunk - chunk_mean
+        self._merge(len(chunk), chunk_mean, centered.T @ centered)
+
+    def merge(self, other):
+        self._merge(other.count, other.mean, other.comoment)
+
+    def variance(self, ddof=0):
+        return np.diag(self.comoment) / (self.count - ddof)
+
+    def correlation(self):
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = self.comoment / np.outer(std, std)
+        # Constant columns have no correlation, as with DataFrame.corr()
+        corr[std == 0, :] = np.nan
+        corr[:, std == 0] = np.nan
+        return corr
+
+    def correlated_columns(self, threshold=0.95, verbose=False):
+        """Same columns as dataframe_drop_correlated_columns would drop."""
+        if verbose:
+            print('Dropping correlated columns')
+        if threshold == -1:
+            return []
+
+        corr = np.abs(self.correlation())
+        # A column is dropped if it is highly correlated with any column before it
+        return [column for j, column in enumerate(self.columns) if np.any(corr[:j, j] > threshold)]
+
+    def standard_scaler(self, columns=None):
+        """A StandardScaler fitted on the given columns, without another pass over the data."""
+        from sklearn.preprocessing import StandardScaler
+
+        index = [self.columns.index(col) for col in (columns if columns is not None else self.columns)]
+        mean = self.mean[index].copy()
+        var = self.variance()[index]
+        # Near-constant features get a scale of 1, with the same bound StandardScaler uses
+        eps = np.finfo(np.float64).eps
+        constant = var <= self.count * eps * var + (self.count * mean * eps) ** 2
+        scale = np.sqrt(var)
+        scale[constant] = 1.0
+
+        scaler = StandardScaler()
+        scaler.mean_ = mean
+        scaler.var_ = var
+        scaler.scale_ = scale
+        scaler.n_samples_seen_ = self.count
+        scaler.n_features_in_ = len(index)
+        return scaler
+
 def file_write_args(args, file_name, one_line=False):
     args = vars(args)
     with open(file_name, "a") as file:
@@ -36,6 +119,11 @@ def file_write_args(args, file_name, one_line=False):
         file.write('END ARGUMENTS\n')
 
 def plot_probability_density(array, output_file, cutoffvalue=2):
+    # Plotting libraries are imported on use so serving never pays for them
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    import scipy.stats as stats
+
     array[array > cutoffvalue] = cutoffvalue
     plt.clf()
     sns_plot = sns.distplot(array, hist=True, kde=True, rug=False, fit=stats.norm,
@@ -50,6 +138,8 @@ def plot_probability_density(array, output_file, cutoffvalue=2):
     sns_plot.figure.savefig(output_file)
    
 def plot_model_history(hist, output_file):
+    import matplotlib.pyplot as plt
+
     plt.clf()
     plt.plot(hist.history['accuracy'], label='Training Accuracy')
     plt.plot(hist.history['val_accuracy'], label='Validation Accuracy')
@@ -60,35 +150,37 @@ def plot_model_history(hist, output_file):
     plt.legend(loc='center right')
     plt.savefig(output_file)
 
+# KDD attack name -> main class
+kdd_main_classes = {
+    'normal': 'normal',
+    'back': 'dos',
+    'buffer_overflow': 'u2r',
+    'ftp_write': 'r2l',
+    'guess_passwd': 'r2l',
+    'imap': 'r2l',
+    'ipsweep': 'probe',
+    'land': 'dos',
+    'loadmodule': 'u2r',
+    'multihop': 'r2l',
+    'nmap': 'probe',
+    'neptune': 'dos',
+    'perl': 'u2r',
+    'phf': 'r2l',
+    'pod': 'dos',
+    'portsweep': 'probe',
+    'rootkit': 'u2r',
+    'satan': 'probe',
+    'smurf': 'dos',
+    'spy': 'r2l',
+    'teardrop': 'dos',
+    'warezclient': 'r2l',
+    'warezmaster': 'r2l'
+}
+
 def add_kdd_main_classes(dataset):
-    base_classes_map = {
-        'normal': 'normal',
-        'back': 'dos',
-        'buffer_overflow': 'u2r',
-        'ftp_write': 'r2l',
-        'guess_passwd': 'r2l',
-        'imap': 'r2l',
-        'ipsweep': 'probe',
-        'land': 'dos',
-        'loadmodule': 'u2r',
-        'multihop': 'r2l',
-        'nmap': 'probe',
-        'neptune': 'dos',
-        'perl': 'u2r',
-        'phf': 'r2l',
-        'pod': 'dos',
-        'portsweep': 'probe',
-        'rootkit': 'u2r',
-        'satan': 'probe',
-        'smurf': 'dos',
-        'spy': 'r2l',
-        'teardrop': 'dos',
-        'warezclient': 'r2l',
-        'warezmaster': 'r2l'
-    }
-    
-    for key in base_classes_map:
-        dataset[dataset[:, 41] == key, 42] = base_classes_map[key]
+    mapped = pd.Series(dataset[:, 41]).map(kdd_main_classes)
+    known = mapped.notna().to_numpy()
+    dataset[known, 42] = mapped[known].to_numpy()
     return dataset
 
 def process_new_dataset(df):
@@ -0,0 +1,97 @@
+import math
+import numpy as np
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch of non-negative values, in the style of
+    DDSketch: values are counted in logarithmic buckets, so every quantile,
+    including the far tail a threshold sits in, comes back within
+    relative_accuracy of the true value. Sketches with the same accuracy
+    merge by adding their bucket counts. Values below min_value count as 0.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-12):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+
+    def _grow(self, low, high):
+        # Bucket i of self.counts holds index self.offset + i
+        if not len(self.counts):
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+            return
+        current_high = self.offset + len(self.counts) - 1
+        if low >= self.offset and high <= current_high:
+            return
+        new_low, new_high = min(low, self.offset), max(high, current_high)
+        counts = np.zeros(new_high - new_low + 1, dtype=np.int64)
+        counts[self.offset - new_low:self.offset - new_low + len(self.counts)] = self.counts
+        self.offset, self.counts = new_low, counts
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        small = values < self.min_value
+        self.zero_count += int(small.sum())
+        self.count += len(values)
+        values = values[~small]
+        if len(values):
+            index = np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+            self._grow(int(index.min()), int(index.max()))
+            self.counts += np.bincount(index - self.offset, minlength=len(self.counts))
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        if len(other.counts):
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] += other.counts
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def copy(self):
+        return QuantileSketch.from_dict(self.to_dict())
+
+    def quantile(self, q):
+        """Estimate of the q-quantile (0 <= q <= 1), None while the sketch is empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count + np.cumsum(self.counts)
+        i = min(int(np.searchsorted(cumulative, rank, side='right')), len(self.counts) - 1)
+        return 2 * self.gamma ** (self.offset + i) / (self.gamma + 1)
+
+    def to_dict(self):
+        # Only the non-empty stretch of buckets is stored
+        nonzero = np.flatnonzero(self.counts)
+        low, high = (int(nonzero[0]), int(nonzero[-1]) + 1) if len(nonzero) else (0, 0)
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'min_value': self.min_value,
+            'offset': self.offset + low,
+            'counts': self.counts[low:high].tolist(),
+            'zero_count': self.zero_count,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['relative_accuracy'], state['min_value'])
+        sketch.offset = state['offset']
+        sketch.counts = np.array(state['counts'], dtype=np.int64)
+        sketch.zero_count = state['zero_count']
+        sketch.count = state['count']
+        return sketch
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import struct
+import numpy as np
+
+format_version = 1
+stream_name = 'network_logs'
+# Stream entries in the packed format carry a single field holding the record
+record_field = 'r'
+
+# KDD vocabularies, id 0 is kept for values outside them
+categorical_values = {
+    'protocol_type': ['icmp', 'tcp', 'udp'],
+    'service': [
+        'aol', 'auth', 'bgp', 'courier', 'csnet_ns', 'ctf', 'daytime', 'discard', 'domain', 'domain_u',
+        'echo', 'eco_i', 'ecr_i', 'efs', 'exec', 'finger', 'ftp', 'ftp_data', 'gopher', 'harvest',
+        'hostnames', 'http', 'http_2784', 'http_443', 'http_8001', 'imap4', 'IRC', 'iso_tsap', 'klogin',
+        'kshell', 'ldap', 'link', 'login', 'mtp', 'name', 'netbios_dgm', 'netbios_ns', 'netbios_ssn',
+        'netstat', 'nnsp', 'nntp', 'ntp_u', 'other', 'pm_dump', 'pop_2', 'pop_3', 'printer', 'private',
+        'red_i', 'remote_job', 'rje', 'shell', 'smtp', 'sql_net', 'ssh', 'sunrpc', 'supdup', 'systat',
+        'telnet', 'tftp_u', 'tim_i', 'time', 'urh_i', 'urp_i', 'uucp', 'uucp_path', 'vmnet', 'whois',
+        'X11', 'Z39_50',
+    ],
+    'flag': ['OTH', 'REJ', 'RSTO', 'RSTOS0', 'RSTR', 'S0', 'S1', 'S2', 'S3', 'SF', 'SH'],
+}
+unknown_value = 'other'
+
+
+class RecordSchema:
+    """
+    Packed layout of one feature record: a header (format version, field
+    counts and the schema id), categorical fields as uint16 vocabulary ids
+    and the numeric fields as one little-endian float32 block. Records of a
+    batch can be joined and decoded with a single np.frombuffer call.
+    """
+
+    def __init__(self, fields, categories=categorical_values):
+        self.fields = list(fields)
+        self.categories = {name: list(values) for name, values in categories.items() if name in self.fields}
+        self.categorical_fields = [name for name in self.fields if name in self.categories]
+        self.numeric_fields = [name for name in self.fields if name not in self.categories]
+        self.ids = {name: {value: i + 1 for i, value in enumerate(values)} for name, values in self.categories.items()}
+        self.labels = {name: np.array([unknown_value] + values, dtype=object) for name, values in self.categories.items()}
+
+        description = json.dumps({'version': format_version, 'fields': self.fields, 'categories': self.categories},
+                                 sort_keys=True)
+        self.schema_id = int.from_bytes(hashlib.blake2b(description.encode(), digest_size=8).digest(), 'little')
+
+        num_categorical = len(self.categorical_fields)
+        numeric_offset = 12 + 2 * num_categorical
+        numeric_offset += -numeric_offset % 4
+        self.dtype = np.dtype({
+            'names': ['version', 'num_categorical', 'num_numeric', 'schema', 'categorical', 'numeric'],
+            'formats': ['u1', 'u1', '<u2', '<u8', ('<u2', (num_categorical,)), ('<f4', (len(self.numeric_fields),))],
+            'offsets': [0, 1, 2, 4, 12, numeric_offset],
+            'itemsize': numeric_offset + 4 * len(self.numeric_fields),
+        })
+        self.packer = struct.Struct(f'<BBHQ{num_categorical}H{numeric_offset - 12 - 2 * num_categorical}x'
+                                    f'{len(self.numeric_fields)}f')
+        self.header = (format_version, num_categorical, len(self.numeric_fields), self.schema_id)
+
+    @property
+    def schema_key(self):
+        return f'{self.schema_id:016x}'
+
+    def to_json(self):
+        return json.dumps({'version': format_version, 'fields': self.fields, 'categories': self.categories})
+
+    @classmethod
+    def from_json(cls, text):
+        description = json.loads(text)
+        if description['version'] != format_version:
+            raise ValueError(f"Unsupported record format version {description['version']}")
+        return cls(description['fields'], description['categories'])
+
+    def encode(self, feature_dict):
+        get = feature_dict.get
+        return self.packer.pack(*self.header,
+                                *[self.ids[name].get(str(get(name, unknown_value)), 0) for name in self.categorical_fields],
+                                *[float(get(name, 0)) for name in self.numeric_fields])
+
+    def decode(self, blobs):
+        """Structured array of records, a view of the joined blobs."""
+        records = np.frombuffer(b''.join(blobs), dtype=self.dtype)
+        if len(records) and not np.all(records['version'] == format_version):
+            raise ValueError("Unsupported record format version")
+        return records
+
+    def numeric_matrix(self, records, fields):
+        """The given numeric fields as a float64 matrix."""
+        index = [self.numeric_fields.index(name) for name in fields]
+        return records['numeric'][:, index].astype(np.float64)
+
+    def lines(self, records):
+        """CSV text of the records in field order, as the text log writes them."""
+        numeric = records['numeric']
+        # Feature values repeat a lot, format each distinct one once
+        values, inverse = np.unique(numeric, return_inverse=True)
+        text = np.array([format_number(value) for value in values.tolist()], dtype=object)
+
+        table = np.empty((len(records), len(self.fields)), dtype=object)
+        table[:, [self.fields.index(name) for name in self.numeric_fields]] = text[inverse.reshape(numeric.shape)]
+        for i, name in enumerate(self.categorical_fields):
+            table[:, self.fields.index(name)] = self.labels[name][records['categorical'][:, i]]
+        return [','.join(row) for row in table.tolist()]
+
+
+def format_number(value):
+    return str(int(value)) if value.is_integer() else f'{value:.7g}'
+
+def schema_redis_key(schema_id, stream=stream_name):
+    return f'{stream}:schema:{schema_id:016x}'
+
+def register_schema(redis_client, schema, stream=stream_name):
+    """Publish the schema so consumers can decode records that carry its id."""
+    redis_client.set(schema_redis_key(schema.schema_id, stream), schema.to_json())
+    redis_client.set(f'{stream}:schema', schema.schema_key)
+
+def to_text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RecordDecoder:
+    """
+    Splits a batch of stream entries into text entries (field -> string) and
+    packed records, grouped by schema id. Schemas not seen before are looked
+    up in Redis under the id the producer registered.
+    """
+
+    def __init__(self, redis_client=None, stream=stream_name, schemas=()):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.schemas = {schema.schema_id: schema for schema in schemas}
+
+    def schema(self, schema_id):
+        schema = self.schemas.get(schema_id)
+        if schema is None:
+            text = None
+            if self.redis_client is not None:
+                text = self.redis_client.get(schema_redis_key(schema_id, self.stream))
+            if text is None:
+                raise KeyError(f"Unknown record schema {schema_id:016x}")
+            schema = self.schemas[schema_id] = RecordSchema.from_json(to_text(text))
+        return schema
+
+    def split(self, entries):
+        """
+        Returns (index, data) of the text entries, with str keys and values,
+        and a list of (indexes, schema, records) for the packed ones.
+        """
+        text = []
+        packed = {}
+        for i, data in enumerate(entries):
+            blob = data.get(record_field.encode(), data.get(record_field)) if len(data) == 1 else None
+            if isinstance(blob, bytes):
+                schema_id = int.from_bytes(blob[4:12], 'little')
+                group = packed.get(schema_id)
+                if group is None:
+                    group = packed[schema_id] = ([], [])
+                group[0].append(i)
+                group[1].append(blob)
+            else:
+                text.append((i, {to_text(k): to_text(v) for k, v in data.items()}))
+        return text, [(indexes, self.schema(schema_id), self.schema(schema_id).decode(blobs))
+                      for schema_id, (indexes, blobs) in packed.items()]
+
+    def to_dicts(self, entries):
+        """Every entry as a field -> string dict, e.g. for display."""
+        rows = [None] * len(entries)
+        text, packed = self.split(entries)
+        for i, data in text:
+            rows[i] = data
+        for indexes, schema, records in packed:
+            for i, line in zip(indexes, schema.lines(records)):
+                rows[i] = dict(zip(schema.fields, line.split(',')))
+        return rows
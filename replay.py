@@ -0,0 +1,157 @@
+import argparse
+import json
+import time
+import network_logger
+import pcap_decoder
+from flow_table import FlowTable, PacketInfo
+from local_redis import LocalRedis
+from log_writer import BufferedLogWriter
+from record_codec import RecordSchema, register_schema
+from window_stats import TimeWindowStats, HostWindowStats
+
+stages = ('read', 'decode', 'extract', 'write')
+
+
+def reset_state(idle_timeout=15, active_timeout=120, max_bytes=64 * 1024 * 1024):
+    # Fresh flow table and windows, so every replay of the same file gives the same records
+    network_logger.flow_table = FlowTable(idle_timeout, active_timeout, max_bytes)
+    network_logger.time_window_stats = TimeWindowStats(network_logger.history_window)
+    network_logger.host_window_stats = HostWindowStats(network_logger.host_history)
+
+def pyshark_packets(pcap_path):
+    import pyshark
+    return pyshark.FileCapture(pcap_path, keep_packets=False)
+
+def replay(packets, writer=None, speed=0.0, expire_interval=1.0):
+    """
+    Drive network_logger.extract_features with packets from a capture file.
+    Time comes from the packet timestamps: speed=0 runs as fast as possible,
+    otherwise packets are paced at `speed` times their original rate.
+    Returns the time spent in each stage and the packet/record counts.
+    """
+    timings = dict.fromkeys(stages, 0.0)
+    packet_count = 0
+    record_count = 0
+    first_ts = None
+    last_expire = None
+    start_wall = time.perf_counter()
+    packet_iter = iter(packets)
+
+    while True:
+        t0 = time.perf_counter()
+        try:
+            pkt = next(packet_iter)
+        except StopIteration:
+            break
+        t1 = time.perf_counter()
+        try:
+            info = pkt if isinstance(pkt, PacketInfo) else network_logger.packet_info(pkt)
+        except Exception as e:
+            print("Error:", e)
+            info = None
+        t2 = time.perf_counter()
+        timings['read'] += t1 - t0
+        timings['decode'] += t2 - t1
+        packet_count += 1
+        if info is None:
+            continue
+
+        now = info.timestamp
+        if first_ts is None:
+            first_ts = last_expire = now
+        if speed > 0:
+            delay = (now - first_ts) / speed - (time.perf_counter() - start_wall)
+            if delay > 0:
+                time.sleep(delay)
+            t2 = time.perf_counter()
+
+        records = []
+        feats = network_logger.extract_features(info)
+        if feats:
+            records.append(feats)
+        if now - last_expire >= expire_interval:
+            records += network_logger.flush_flows(now)
+            last_expire = now
+        t3 = time.perf_counter()
+        timings['extract'] += t3 - t2
+
+        if writer is not None:
+            for feats in records:
+                writer.write(feats)
+        timings['write'] += time.perf_counter() - t3
+        record_count += len(records)
+
+    # Whatever is still open at the end of the capture is reported too
+    t0 = time.perf_counter()
+    records = network_logger.flush_flows(float('inf'))
+    t1 = time.perf_counter()
+    if writer is not None:
+        for feats in records:
+            writer.write(feats)
+        writer.close()
+    timings['extract'] += t1 - t0
+    timings['write'] += time.perf_counter() - t1
+    record_count += len(records)
+
+    return {
+        'packets': packet_count,
+        'records': record_count,
+        'wall_seconds': time.perf_counter() - start_wall,
+        'stage_seconds': timings,
+        'flow_table': network_logger.flow_table.stats(),
+    }
+
+def print_report(report):
+    print(f"{report['packets']} packets, {report['records']} records in {report['wall_seconds']:.3f}s")
+    print(f"{'stage':<10}{'seconds':>10}{'packets/sec':>14}{'records/sec':>14}")
+    for stage, seconds in report['stage_seconds'].items():
+        packets_per_sec = report['packets'] / seconds if seconds else float('inf')
+        records_per_sec = report['records'] / seconds if seconds else float('inf')
+        print(f"{stage:<10}{seconds:>10.3f}{packets_per_sec:>14.0f}{records_per_sec:>14.0f}")
+    print("Flow table:", report['flow_table'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a pcap through the network_logger feature extractor')
+    parser.add_argument('pcap_path')
+    parser.add_argument('--decoder', choices=['struct', 'pyshark'], default='struct')
+    parser.add_argument('--speed', type=float, default=0.0, help='0 = as fast as possible, 1 = real time, 10 = ten times faster')
+    parser.add_argument('--output', default=None, help='Append the KDD records to this file')
+    parser.add_argument('--redis', default='local', help="'local' for the in-process stand-in, host:port for a server, or 'none'")
+    parser.add_argument('--record_format', choices=['text', 'packed'], default='text')
+    parser.add_argument('--idle_timeout', type=float, default=15)
+    parser.add_argument('--active_timeout', type=float, default=120)
+    parser.add_argument('--max_flow_mb', type=float, default=64)
+    parser.add_argument('--json', default=None, help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    if args.redis == 'none':
+        redis_client = None
+    elif args.redis == 'local':
+        redis_client = LocalRedis()
+    else:
+        import redis
+        host, port = args.redis.rsplit(':', 1)
+        redis_client = redis.Redis(host=host, port=int(port), decode_responses=True)
+
+    encoder = None
+    if args.record_format == 'packed' and redis_client is not None:
+        schema = RecordSchema(network_logger.all_fields)
+        register_schema(redis_client, schema)
+        encoder = schema.encode
+
+    writer = None
+    if args.output or redis_client is not None:
+        writer = BufferedLogWriter(args.output, redis_client, network_logger.all_fields, encoder=encoder)
+
+    reset_state(args.idle_timeout, args.active_timeout, int(args.max_flow_mb * 1024 * 1024))
+    if args.decoder == 'struct':
+        packets = pcap_decoder.read_pcap(args.pcap_path)
+    else:
+        packets = pyshark_packets(args.pcap_path)
+    report = replay(packets, writer, args.speed)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
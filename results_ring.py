@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on Windows, a lock file keeps it to one writer per ring there
+    fcntl = None
+
+ring_path = 'results_ring.bin'
+magic = b'HBRING01'
+header_size = 128
+empty_seq = np.iinfo(np.uint64).max
+
+header_dtype = np.dtype([
+    ('magic', 'S8'),
+    ('num_features', '<u4'),
+    ('record_size', '<u4'),
+    ('capacity', '<u8'),
+    # Records are written after reserved is raised and published when committed catches up
+    ('reserved', '<u8'),
+    ('committed', '<u8'),
+    ('total_normal', '<u8'),
+    ('total_suspicious', '<u8'),
+    ('window_normal', '<u8'),
+    ('window_suspicious', '<u8'),
+])
+
+
+def record_dtype(num_features):
+    return np.dtype([
+        ('seq', '<u8'),
+        ('timestamp', '<f8'),
+        ('error', '<f8'),
+        ('verdict', 'S1'),
+        ('features', '<f4', (num_features,)),
+    ], align=True)
+
+
+class ResultsRing:
+    """
+    Fixed-size ring of scored records (sequence number, timestamp, verdict,
+    reconstruction error and float32 features) in a memory-mapped file.
+    Writers append whole batches under an exclusive file lock; readers in
+    other processes query it without taking any lock, checking sequence numbers instead, so a record
+    overwritten while it was being copied is left out rather than torn.
+    """
+
+    def __init__(self, path, header, records, writable, writer_lock=None):
+        self.path = path
+        self.header = header
+        self.records = records
+        self.writable = writable
+        self.capacity = int(header['capacity'][0])
+        self.num_features = int(header['num_features'][0])
+        self.lock_file = open(path, 'rb') if writable and fcntl is not None else None
+        self.writer_lock = writer_lock
+
+    @classmethod
+    def create(cls, path=ring_path, num_features=0, capacity=100000):
+        """
+        Open the ring for writing, (re)creating the file unless it already has
+        this layout. Without fcntl a second writer of the same ring is refused.
+        """
+        dtype = record_dtype(num_features)
+        size = header_size + dtype.itemsize * capacity
+        writer_lock = claim_writer(path) if fcntl is None else None
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            header = np.memmap(path, dtype=header_dtype, mode='r+', shape=(1,))
+            if (header['magic'][0] == magic and header['num_features'][0] == num_features
+                    and header['capacity'][0] == capacity and header['record_size'][0] == dtype.itemsize):
+                records = np.memmap(path, dtype=dtype, mode='r+', offset=header_size, shape=(capacity,))
+                ring = cls(path, header, records, writable=True, writer_lock=writer_lock)
+                # A writer that died mid-append leaves reserved ahead of committed, other writers may be appending
+                with ring.locked():
+                    header['reserved'] = header['committed']
+                return ring
+            del header
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.truncate(size)
+        header = np.memmap(tmp_path, dtype=header_dtype, mode='r+', shape=(1,))
+        header[0] = (magic, num_features, dtype.itemsize, capacity, 0, 0, 0, 0, 0, 0)
+        records = np.memmap(tmp_path, dtype=dtype, mode='r+', offset=header_size, shape=(capacity,))
+        records['seq'] = empty_seq
+        records.flush()
+        header.flush()
+        del header, records
+        os.replace(tmp_path, path)
+        header = np.memmap(path, dtype=header_dtype, mode='r+', shape=(1,))
+        records = np.memmap(path, dtype=dtype, mode='r+', offset=header_size, shape=(capacity,))
+        return cls(path, header, records, writable=True, writer_lock=writer_lock)
+
+    @classmethod
+    def open(cls, path=ring_path):
+        """Open an existing ring read-only."""
+        header = np.memmap(path, dtype=header_dtype, mode='r', shape=(1,))
+        if header['magic'][0] != magic:
+            raise ValueError(f"{path} is not a results ring")
+        dtype = record_dtype(int(header['num_features'][0]))
+        records = np.memmap(path, dtype=dtype, mode='r', offset=header_size, shape=(int(header['capacity'][0]),))
+        return cls(path, header, records, writable=False)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Exclusive lock against the other writers of the ring (a no-op for the single writer without fcntl)."""
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if self.lock_file is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def append(self, verdicts, errors, features, timestamp=None):
+        """Append one scored batch: verdicts ('S'/'N'), reconstruction errors and raw feature rows."""
+        if not self.writable:
+            raise ValueError("Ring was opened read-only")
+        verdicts = np.asarray(verdicts).astype('S1')
+        count = len(verdicts)
+        if not count:
+            return
+        errors = np.asarray(errors, dtype=np.float64)
+        features = np.asarray(features, dtype=np.float32).reshape(count, self.num_features)
+        suspicious = verdicts == b'S'
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self.locked():
+            header = self.header
+            start = int(header['committed'][0])
+            end = start + count
+            header['reserved'] = end
+            header['total_suspicious'] += int(suspicious.sum())
+            header['total_normal'] += count - int(suspicious.sum())
+
+            # Only the last `capacity` records of an oversized batch can be kept
+            keep = min(count, self.capacity)
+            seqs = np.arange(end - keep, end, dtype=np.uint64)
+            slots = seqs % np.uint64(self.capacity)
+
+            evicted = self.records[slots]
+            evicted = evicted[evicted['seq'] != empty_seq]
+            evicted_suspicious = int(np.sum(evicted['verdict'] == b'S'))
+            header['window_suspicious'] -= evicted_suspicious
+            header['window_normal'] -= len(evicted) - evicted_suspicious
+
+            records = self.records
+            records['seq'][slots] = empty_seq
+            records['timestamp'][slots] = timestamp
+            records['error'][slots] = errors[-keep:]
+            records['verdict'][slots] = verdicts[-keep:]
+            records['features'][slots] = features[-keep:]
+            records['seq'][slots] = seqs
+
+            kept_suspicious = int(suspicious[-keep:].sum())
+            header['window_suspicious'] += kept_suspicious
+            header['window_normal'] += keep - kept_suspicious
+            header['committed'] = end
+
+    def since(self, seq, limit=None):
+        """Records with sequence number >= seq that are still in the ring, oldest first."""
+        committed = int(self.header['committed'][0])
+        low = max(int(seq), committed - self.capacity, 0)
+        high = committed if limit is None else min(committed, low + limit)
+        if high <= low:
+            return np.empty(0, dtype=self.records.dtype)
+
+        expected = np.arange(low, high, dtype=np.uint64)
+        batch = np.array(self.records[expected % np.uint64(self.capacity)])
+        # Anything the writer may have started overwriting during the copy is dropped
+        reserved = int(self.header['reserved'][0])
+        valid = (batch['seq'] == expected) & (expected >= max(reserved - self.capacity, 0))
+        return batch[valid]
+
+    def latest(self, count):
+        """The last `count` records, oldest first."""
+        return self.since(int(self.header['committed'][0]) - count)
+
+    def counters(self):
+        """Total and in-ring normal/suspicious counts, read consistently with the writer."""
+        for attempt in range(1000):
+            committed = int(self.header['committed'][0])
+            snapshot = self.header[0].copy()
+            if int(self.header['reserved'][0]) == committed == int(snapshot['committed']):
+                break
+            time.sleep(0.0001)
+        return {
+            'records': committed,
+            'capacity': self.capacity,
+            'total_normal': int(snapshot['total_normal']),
+            'total_suspicious': int(snapshot['total_suspicious']),
+            'window_normal': int(snapshot['window_normal']),
+            'window_suspicious': int(snapshot['window_suspicious']),
+        }
+
+    def close(self):
+        if self.writable:
+            self.records.flush()
+            self.header.flush()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+        if self.writer_lock is not None:
+            os.remove(self.writer_lock)
+            self.writer_lock = None
+
+
+def claim_writer(path):
+    """Create path.writer, or fail when another process already writes the ring."""
+    writer_lock = path + '.writer'
+    try:
+        os.close(os.open(writer_lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise RuntimeError(f"{path} is already open for writing, remove {writer_lock} "
+                           f"if the process writing it is gone") from None
+    return writer_lock
+
+
+def record_dicts(records, feature_columns=None):
+    """JSON-friendly rows, with features keyed by column name when feature_columns is given."""
+    rows = []
+    for record in records:
+        features = record['features'].tolist()
+        rows.append({
+            'seq': int(record['seq']),
+            'timestamp': float(record['timestamp']),
+            'verdict': record['verdict'].decode(),
+            'error': float(record['error']),
+            'features': dict(zip(feature_columns, features)) if feature_columns else features,
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print counters and recent records of the results ring as JSON')
+    parser.add_argument('--ring_path', default=ring_path)
+    parser.add_argument('--latest', type=int, default=10, help='Number of most recent records')
+    parser.add_argument('--since', type=int, default=None, help='Records from this sequence number on, instead of --latest')
+    parser.add_argument('--features_path', default=None, help='features.json, to name the feature values')
+    args = parser.parse_args()
+
+    ring = ResultsRing.open(args.ring_path)
+    records = ring.since(args.since) if args.since is not None else ring.latest(args.latest)
+    feature_columns = None
+    if args.features_path:
+        with open(args.features_path) as f:
+            feature_columns = json.load(f)['columns']
+    print(json.dumps({'counters': ring.counters(), 'records': record_dicts(records, feature_columns)}, indent=2))
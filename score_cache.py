@@ -0,0 +1,94 @@
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class ScoreCache:
+    """
+    Bounded LRU cache of reconstruction errors keyed by the scaled feature
+    vector. With quantum=0 keys are the exact float64 bytes, otherwise each
+    value is rounded to a multiple of quantum first, so near-identical rows
+    share an entry. Cleared whenever one of the watched artifact files
+    changes on disk (checked at most every check_interval seconds).
+    """
+
+    def __init__(self, max_entries=65536, quantum=0.0, watch_paths=(), check_interval=1.0):
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.watch_paths = [path for path in watch_paths if path]
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.signature = self._signature()
+        self.last_check = time.monotonic()
+
+    def _signature(self):
+        signature = []
+        for path in self.watch_paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return signature
+
+    def check_artifacts(self):
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        signature = self._signature()
+        if signature != self.signature:
+            self.signature = signature
+            self.clear()
+            self.invalidations += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def keys(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if self.quantum:
+            rows = np.round(rows / self.quantum).astype(np.int64)
+        rows = np.ascontiguousarray(rows)
+        return [row.tobytes() for row in rows]
+
+    def lookup(self, keys):
+        """Cached errors (NaN where missing) and the mask of misses."""
+        errors = np.full(len(keys), np.nan)
+        entries = self.entries
+        for i, key in enumerate(keys):
+            error = entries.get(key)
+            if error is not None:
+                entries.move_to_end(key)
+                errors[i] = error
+        missing = np.isnan(errors)
+        misses = int(missing.sum())
+        self.misses += misses
+        self.hits += len(keys) - misses
+        return errors, missing
+
+    def store(self, keys, errors):
+        entries = self.entries
+        for key, error in zip(keys, errors):
+            entries[key] = float(error)
+            entries.move_to_end(key)
+        overflow = len(entries) - self.max_entries
+        for _ in range(max(overflow, 0)):
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,114 @@
+import argparse
+import io
+import mmap
+import multiprocessing
+import os
+import time
+import numpy as np
+import pandas as pd
+import serve
+from split_dataset import line_ranges
+
+# Model and settings of a scoring process, loaded once by _init_worker
+_state = {}
+
+
+def _init_worker(args):
+    model, standard_scaler, threshold, feature_columns = serve.load_artifacts(
+        args.model_path, args.scaler_path, args.threshold_path, args.features_path,
+        args.engine, args.weights_path, args.dtype)
+    _state.update(input_file=args.input_file, model=model, standard_scaler=standard_scaler,
+                  threshold=threshold if args.threshold is None else args.threshold,
+                  usecols=[int(col[3:]) for col in feature_columns])
+
+def parse_features(data, usecols):
+    """Feature matrix of CSV bytes, with the same non-numeric coercion as the stream consumer."""
+    try:
+        frame = pd.read_csv(io.BytesIO(data), header=None, usecols=usecols, dtype=np.float64, engine='c')
+    except ValueError:
+        frame = pd.read_csv(io.BytesIO(data), header=None, usecols=usecols, dtype=str, engine='c')
+        frame = frame.apply(pd.to_numeric, errors='coerce')
+    # Empty fields read as NaN on either path, and become 0 like anything non-numeric
+    return frame[usecols].fillna(0).to_numpy(dtype=np.float64)
+
+def score_lines(lines):
+    """Verdicts and reconstruction errors of a list of CSV lines (bytes, without newlines)."""
+    state = _state
+    log_rows = parse_features(b'\n'.join(lines), state['usecols'])
+    log_scaled = state['standard_scaler'].transform(log_rows)
+    return serve.predict_batch(state['model'], log_scaled, state['threshold'])
+
+def _score_range(task):
+    start, end = task
+    with open(_state['input_file'], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chunk = data[start:end]
+    if b'\r' in chunk:
+        chunk = chunk.replace(b'\r\n', b'\n')
+    lines = [line for line in chunk.split(b'\n') if line]
+    if not lines:
+        return b'', 0, 0
+
+    results, reconstruction_errors = score_lines(lines)
+    output = b''.join(b'%s,%.6g,%s\n' % (result.encode(), error, line)
+                      for result, error, line in zip(results.tolist(), reconstruction_errors.tolist(), lines))
+    return output, len(lines), int(np.sum(results == 'S'))
+
+def score_file(args):
+    """
+    Score every line of args.input_file and write 'verdict,error,<line>' to
+    args.output_file in input order. Newline-aligned byte ranges are scored
+    by args.workers processes, each with its own copy of the model.
+    Returns (rows, suspicious).
+    """
+    tasks = line_ranges(args.input_file, args.chunk_mb * 1024 * 1024)
+    workers = min(args.workers, max(len(tasks), 1))
+    rows = suspicious = 0
+
+    with open(args.output_file, 'wb') as out:
+        if workers > 1:
+            serve.limit_threads(args.threads_per_worker)
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(workers, initializer=_init_worker, initargs=(args,)) as pool:
+                for output, count, flagged in pool.imap(_score_range, tasks):
+                    out.write(output)
+                    rows += count
+                    suspicious += flagged
+        else:
+            _init_worker(args)
+            for task in tasks:
+                output, count, flagged = _score_range(task)
+                out.write(output)
+                rows += count
+                suspicious += flagged
+    return rows, suspicious
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score a log or KDD file in bulk with the saved model artifacts')
+    parser.add_argument('input_file', help='CSV of KDD records, with or without the label column')
+    parser.add_argument('--output_file', default=None, help="Defaults to <input_file>.scored.csv")
+    parser.add_argument('--model_path', default=serve.model_path)
+    parser.add_argument('--scaler_path', default=serve.scaler_path)
+    parser.add_argument('--threshold_path', default=serve.threshold_path)
+    parser.add_argument('--features_path', default=serve.features_path)
+    parser.add_argument('--threshold', type=float, default=None, help='Override the saved threshold')
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='numpy')
+    parser.add_argument('--weights_path', default=serve.weights_path)
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64', help='Precision of the numpy engine')
+    parser.add_argument('--workers', type=int, default=1, help='Scoring processes, each loads its own model')
+    parser.add_argument('--threads_per_worker', type=int, default=1)
+    parser.add_argument('--chunk_mb', type=int, default=16, help='Size of the byte range scored per task')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.features_path):
+        parser.error(f"{args.features_path} not found, run main.py once to write the feature schema")
+    if args.engine == 'numpy' and not os.path.exists(args.weights_path):
+        parser.error(f"{args.weights_path} not found, run numpy_model.py to export the model weights")
+    if args.output_file is None:
+        args.output_file = args.input_file + '.scored.csv'
+
+    start = time.time()
+    rows, suspicious = score_file(args)
+    seconds = time.time() - start
+    print(f"Scored {rows} rows, {suspicious} suspicious, in {seconds:.2f}s ({rows / max(seconds, 1e-9):.0f} rows/sec)")
+    print(f"Results written to {args.output_file}")
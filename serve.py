@@ -0,0 +1,471 @@
+import argparse
+import json
+import os
+import time
+import joblib
+import numpy as np
+import redis
+from numpy_model import NumpyAutoencoder, weights_path
+from results_ring import ResultsRing, ring_path
+import metrics
+from fine_tune import FineTuner
+from record_codec import RecordDecoder
+from score_cache import ScoreCache
+from threshold_calibrator import ThresholdCalibrator, load_trained_threshold, sketch_path
+
+# KDD features (same order used when writing to Redis)
+all_fields = [
+    "duration", "protocol_type", "service", "flag", "src_bytes", "dst_bytes", "land", "wrong_fragment",
+    "urgent", "hot", "num_failed_logins", "logged_in", "num_compromised", "root_shell",
+    "su_attempted", "num_root", "num_file_creations", "num_shells", "num_access_files",
+    "num_outbound_cmds", "is_host_login", "is_guest_login", "count", "srv_count", "serror_rate",
+    "srv_serror_rate", "rerror_rate", "srv_rerror_rate", "same_srv_rate", "diff_srv_rate",
+    "srv_diff_host_rate", "dst_host_count", "dst_host_srv_count", "dst_host_same_srv_rate",
+    "dst_host_diff_srv_rate", "dst_host_same_src_port_rate", "dst_host_srv_diff_host_rate",
+    "dst_host_serror_rate", "dst_host_srv_serror_rate", "dst_host_rerror_rate",
+    "dst_host_srv_rerror_rate"
+]
+
+model_path = 'saved_model.h5'
+scaler_path = 'scaler.pkl'
+threshold_path = 'threshold.json'
+features_path = 'features.json'
+
+
+def save_feature_schema(feature_columns, dropped_cols, path=features_path):
+    # The selected 'colN' training columns, so serving never needs the training set
+    schema = {
+        'columns': list(feature_columns),
+        'fields': [all_fields[int(col[3:])] for col in feature_columns],
+        'dropped': list(dropped_cols),
+    }
+    with open(path, 'w') as f:
+        json.dump(schema, f)
+
+def load_feature_schema(path=features_path):
+    with open(path) as f:
+        return json.load(f)['columns']
+
+def artifacts_exist(paths=(model_path, scaler_path, threshold_path, features_path)):
+    return all(os.path.exists(path) for path in paths)
+
+def load_model(model_file=model_path, engine='keras', weights_file=weights_path, dtype='float64'):
+    if engine == 'numpy':
+        # Exported Dense weights, scored without importing TensorFlow
+        return NumpyAutoencoder.load(weights_file, dtype=dtype)
+
+    # TensorFlow is only needed to run the Keras model, not to parse arguments or read the stream
+    from tensorflow.keras.models import load_model as load_keras_model
+    return load_keras_model(model_file, compile=False)
+
+def load_artifacts(model_file=model_path, scaler_file=scaler_path,
+                   threshold_file=threshold_path, features_file=features_path,
+                   engine='keras', weights_file=weights_path, dtype='float64'):
+    model = load_model(model_file, engine, weights_file, dtype)
+    standard_scaler = joblib.load(scaler_file)
+    with open(threshold_file) as f:
+        threshold = json.load(f)['threshold']
+    feature_columns = load_feature_schema(features_file)
+    return model, standard_scaler, threshold, feature_columns
+
+def limit_threads(threads):
+    # Call before starting worker processes, they inherit the environment when BLAS / TensorFlow load
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[var] = str(threads)
+
+def model_errors(model, rows):
+    # One forward pass for the whole batch instead of one per row
+    prediction = np.asarray(model.predict_on_batch(rows))
+    return np.mean(np.square(rows - prediction), axis=1)
+
+def predict_batch(model, rows, threshold, cache=None):
+    if cache is None:
+        reconstruction_errors = model_errors(model, rows)
+    else:
+        cache.check_artifacts()
+        keys = cache.keys(rows)
+        reconstruction_errors, missing = cache.lookup(keys)
+        if missing.any():
+            # Rows repeated within the batch only go through the model once
+            miss_index = {}
+            for i in np.flatnonzero(missing):
+                miss_index.setdefault(keys[i], []).append(i)
+            first = [indexes[0] for indexes in miss_index.values()]
+            errors = model_errors(model, rows[first])
+            for indexes, error in zip(miss_index.values(), errors):
+                reconstruction_errors[indexes] = error
+            cache.store(miss_index.keys(), errors)
+    results = np.where(reconstruction_errors >= threshold, "S", "N")
+    return results, reconstruction_errors
+
+def open_cache(size, quantum=0.0, engine='keras', model_file=model_path, weights_file=weights_path,
+               scaler_file=scaler_path):
+    # A size of 0 turns the score cache off. The threshold is not watched, the
+    # cache holds reconstruction errors and verdicts are taken after the lookup
+    if size <= 0:
+        return None
+    model_artifact = weights_file if engine == 'numpy' else model_file
+    return ScoreCache(size, quantum, watch_paths=(model_artifact, scaler_file))
+
+def open_calibrator(threshold, interval, quantile=0.999, window=1000000, min_count=1000, group_by='',
+                    threshold_file=threshold_path, state_file=sketch_path, max_change=2.0):
+    # An interval of 0 keeps the saved threshold fixed
+    if interval <= 0:
+        return None
+    # threshold may already be a recalibrated one, the bound is relative to the model's own
+    trained_threshold = load_trained_threshold(threshold_file) if os.path.exists(threshold_file) else threshold
+    calibrator = ThresholdCalibrator(threshold, threshold_file, quantile, interval, window, min_count,
+                                     [field for field in group_by.split(',') if field], all_fields,
+                                     state_path=state_file, max_change=max_change,
+                                     trained_threshold=trained_threshold)
+    if calibrator.count():
+        # Sketches of an earlier run, pick up where it left off
+        calibrator.update()
+    return calibrator
+
+def open_tuner(interval, keras_model, model, standard_scaler, threshold, feature_columns, engine='keras',
+               dtype='float64', capacity=100000, min_rows=10000, epochs=3, batch_size=1024, learning_rate=1e-4,
+               refit_scaler=True, save=False, model_file=model_path, scaler_file=scaler_path,
+               threshold_file=threshold_path, weights_file=weights_path, loss='mse'):
+    # An interval of 0 keeps the loaded model for the whole run
+    if interval <= 0:
+        return None
+    artifact_paths = (model_file, scaler_file, threshold_file, weights_file) if save else None
+    return FineTuner(keras_model, model, standard_scaler, threshold, feature_columns, engine, dtype, interval,
+                     capacity, min_rows, epochs, batch_size, learning_rate, loss, refit_scaler, artifact_paths).start()
+
+def build_feature_matrix(entries, feature_columns):
+    # Map the selected 'colN' training columns back to their stream field names
+    fields = [all_fields[int(col[3:])] for col in feature_columns]
+    values = [[data.get(feat, '0') for feat in fields] for data in entries]
+    try:
+        # A literal 'nan' parses, count it as 0 like the coercion below
+        return np.nan_to_num(np.array(values, dtype=float), nan=0.0, posinf=np.inf, neginf=-np.inf)
+    except ValueError:
+        # Same coercion as the per-row CSV path: anything non-numeric becomes 0
+        import pandas as pd
+        frame = pd.DataFrame(values, columns=fields)
+        return frame.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+
+def drain_stream(read, batch_size, max_latency_ms):
+    """
+    Collect up to batch_size stream messages from read(count, block),
+    waiting at most max_latency_ms after the first message of the batch arrives.
+    """
+    messages = []
+    deadline = None
+    while len(messages) < batch_size:
+        if deadline is None:
+            block = max(1, max_latency_ms)
+        else:
+            block = int((deadline - time.monotonic()) * 1000)
+            if block <= 0:
+                break
+        response = read(batch_size - len(messages), block)
+        if not response:
+            if deadline is None:
+                continue
+            break
+        for stream, batch in response:
+            messages.extend(batch)
+        if deadline is None:
+            deadline = time.monotonic() + max_latency_ms / 1000.0
+    return messages
+
+class StreamBacklog:
+    """
+    Entries added to the stream that a plain XREAD consumer has not read
+    yet: the stream's entries-added (Redis 7+) since the consumer started,
+    less what it read. Whenever the consumer is at the head the count is
+    re-based, so entries trimmed by maxlen before they were read drop out.
+    """
+
+    def __init__(self, r, stream='network_logs'):
+        self.read = 0
+        try:
+            info = r.xinfo_stream(stream)
+        except redis.ResponseError:
+            # No stream yet, the consumer reads it from the start
+            self.start_id, self.offset = '0-0', 0
+        else:
+            self.start_id, self.offset = info['last-generated-id'], info.get('entries-added')
+
+    def update(self, info, last_id):
+        """Backlog from an XINFO STREAM reply, None where the server doesn't report entries-added."""
+        added = info.get('entries-added')
+        if added is None or self.offset is None:
+            return None
+        if info['last-generated-id'] == last_id:
+            self.offset = added - self.read
+        return min(added - self.offset - self.read, info['length'])
+
+def read_batch(r, last_id, batch_size, max_latency_ms):
+    def read(count, block):
+        nonlocal last_id
+        response = r.xread({'network_logs': last_id}, count=count, block=block)
+        for stream, batch in response:
+            if batch:
+                last_id = batch[-1][0]
+        return response
+
+    messages = drain_stream(read, batch_size, max_latency_ms)
+    return [data for entry_id, data in messages], last_id
+
+def text_lines(entries):
+    return [','.join([data.get(feat, '0') for feat in all_fields]) for data in entries]
+
+def decode_entries(entries, feature_columns, decoder=None):
+    """Log lines and the feature matrix of a batch of stream entries, text or packed."""
+    if decoder is None:
+        return text_lines(entries), build_feature_matrix(entries, feature_columns)
+
+    fields = [all_fields[int(col[3:])] for col in feature_columns]
+    lines = [None] * len(entries)
+    log_rows = np.empty((len(entries), len(fields)))
+    text, packed = decoder.split(entries)
+    if text:
+        index = [i for i, _ in text]
+        data = [data for _, data in text]
+        log_rows[index] = build_feature_matrix(data, feature_columns)
+        for i, line in zip(index, text_lines(data)):
+            lines[i] = line
+    for index, schema, records in packed:
+        log_rows[index] = schema.numeric_matrix(records, fields)
+        for i, line in zip(index, schema.lines(records)):
+            lines[i] = line
+    return lines, log_rows
+
+def score_entries(entries, model, standard_scaler, threshold, feature_columns, cache=None, decoder=None,
+                  calibrator=None, stages=None):
+    # stages: the parse, scale and predict histograms to time into, as the consumer does
+    t0 = time.perf_counter()
+    lines, log_rows = decode_entries(entries, feature_columns, decoder)
+    t1 = time.perf_counter()
+    log_scaled = standard_scaler.transform(log_rows)
+    t2 = time.perf_counter()
+
+    groups = None
+    if calibrator is not None:
+        groups = calibrator.row_groups(lines)
+        threshold = calibrator.row_thresholds(groups)
+    results, reconstruction_errors = predict_batch(model, log_scaled, threshold, cache)
+    if calibrator is not None:
+        calibrator.observe(reconstruction_errors, groups)
+    if stages is not None:
+        parse_time, scale_time, predict_time = stages
+        parse_time.observe(t1 - t0)
+        scale_time.observe(t2 - t1)
+        predict_time.observe(time.perf_counter() - t2)
+    return results, reconstruction_errors, lines, log_rows
+
+def write_results(results, lines, output_path="classified_results.txt"):
+    # Save in format: label, full_log_string
+    # One write per batch, the file holds the latest batch of verdicts
+    output = ''.join(f"{result}, {line}\n" for result, line in zip(results, lines))
+    with open(output_path, "w") as output_file:
+        output_file.write(output)
+
+def open_ring(path, feature_columns, capacity):
+    # An empty path turns the results ring off
+    return ResultsRing.create(path, len(feature_columns), capacity) if path else None
+
+def redis_client(host='localhost', port=6379, record_format='text'):
+    # Packed records are binary, so that client must not decode responses
+    return redis.Redis(host=host, port=port, decode_responses=record_format == 'text')
+
+def record_decoder(r, record_format='text'):
+    # The packed decoder also handles text entries, e.g. from an older producer
+    return RecordDecoder(r) if record_format == 'packed' else None
+
+def consumer_metrics(registry):
+    """Per-batch stage histograms and row counters, shared by the single consumer and the workers."""
+    stage_help = 'Seconds per batch spent in each consumer stage'
+    stages = tuple(registry.histogram('consumer_stage_seconds', stage_help, stage=stage)
+                   for stage in ('read', 'parse', 'scale', 'predict', 'persist'))
+    batch_rows = registry.histogram('consumer_batch_rows', 'Entries per scored batch',
+                                    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096))
+    rows_scored = registry.counter('consumer_rows', 'Stream entries scored')
+    rows_suspicious = registry.counter('consumer_suspicious', 'Entries scored as suspicious')
+    return stages, batch_rows, rows_scored, rows_suspicious
+
+def consume(r, model, standard_scaler, threshold, feature_columns, batch_size=64, max_latency_ms=50, ring=None,
+            cache=None, decoder=None, registry=None, exporter=None, log_interval=10.0, stream='network_logs',
+            calibrator=None, tuner=None):
+    """
+    Score the stream batch by batch. Each stage is timed into `registry`
+    histograms, and a summary line is printed at most every log_interval
+    seconds instead of one per batch. With a calibrator, the reconstruction
+    errors also feed its sketches and the threshold follows its updates.
+    With a tuner, rows scored as normal feed its sample, and the model,
+    scaler and threshold it publishes are switched to between two batches.
+    """
+    registry = registry if registry is not None else metrics.Registry()
+    stages, batch_rows, rows_scored, rows_suspicious = consumer_metrics(registry)
+    read_time, parse_time, scale_time, predict_time, persist_time = stages
+    lag_ms = registry.gauge('consumer_lag_ms', 'Milliseconds between the last entry read and the stream head')
+    backlog_gauge = registry.gauge('consumer_backlog', 'Stream entries added but not read yet (Redis 7+)')
+    threshold_gauge = registry.gauge('threshold', 'Overall anomaly threshold in use')
+    threshold_gauge.set(threshold)
+    threshold_updates = registry.counter('threshold_updates', 'Threshold recalibrations')
+    model_version = tuner.state.version if tuner is not None else 0
+    version_gauge = registry.gauge('model_version', 'Version of the model in use, 0 for the one loaded at start')
+    swap_latency = registry.histogram('model_swap_seconds', 'Seconds from publishing a fine-tuned model to scoring with it')
+    summary_log = metrics.SampledLogger(log_interval)
+    lag_check = metrics.SampledLogger(1.0)
+    logged_rows = logged_suspicious = 0
+
+    print("Listening to Redis stream...")
+    backlog = StreamBacklog(r, stream)
+    last_id = backlog.start_id
+
+    while True:
+        t0 = time.perf_counter()
+        entries, last_id = read_batch(r, last_id, batch_size, max_latency_ms)
+        t1 = time.perf_counter()
+        read_time.observe(t1 - t0)
+        backlog.read += len(entries)
+        if lag_check.ready():
+            info = r.xinfo_stream(stream)
+            lag_ms.set(metrics.stream_lag_ms(last_id, info['last-generated-id']))
+            unread = backlog.update(info, last_id)
+            if unread is not None:
+                backlog_gauge.set(unread)
+        if exporter is not None:
+            exporter.poll()
+        if not entries:
+            continue
+
+        if tuner is not None and tuner.state.version != model_version:
+            switch_start = time.perf_counter()
+            state = tuner.state
+            model, standard_scaler, threshold = state.model, state.standard_scaler, state.threshold
+            model_version = state.version
+            # Cached errors and calibration sketches belong to the previous model
+            if cache is not None:
+                cache.clear()
+            if calibrator is not None:
+                calibrator.reset(threshold)
+            swap_latency.observe(tuner.swapped(state, time.perf_counter() - switch_start))
+            version_gauge.set(model_version)
+            threshold_gauge.set(threshold)
+            t1 = time.perf_counter()
+
+        lines, log_rows = decode_entries(entries, feature_columns, decoder)
+        t2 = time.perf_counter()
+        log_scaled = standard_scaler.transform(log_rows)
+        t3 = time.perf_counter()
+        groups = None
+        batch_threshold = threshold
+        if calibrator is not None:
+            groups = calibrator.row_groups(lines)
+            batch_threshold = calibrator.row_thresholds(groups)
+        results, reconstruction_errors = predict_batch(model, log_scaled, batch_threshold, cache)
+        t4 = time.perf_counter()
+        write_results(results, lines)
+        if ring is not None:
+            ring.append(results, reconstruction_errors, log_rows)
+        if calibrator is not None:
+            calibrator.observe(reconstruction_errors, groups)
+            if calibrator.maybe_update():
+                threshold = calibrator.threshold
+                threshold_gauge.set(threshold)
+                threshold_updates.inc()
+        if tuner is not None:
+            tuner.add(log_rows[results == 'N'])
+        t5 = time.perf_counter()
+
+        parse_time.observe(t2 - t1)
+        scale_time.observe(t3 - t2)
+        predict_time.observe(t4 - t3)
+        persist_time.observe(t5 - t4)
+        suspicious = int(np.sum(results == 'S'))
+        batch_rows.observe(len(entries))
+        rows_scored.inc(len(entries))
+        rows_suspicious.inc(suspicious)
+        logged_rows += len(entries)
+        logged_suspicious += suspicious
+
+        if summary_log.ready():
+            cache_info = f", cache hit rate {cache.stats()['hit_rate']:.1%}" if cache is not None else ""
+            print(f"Scored {logged_rows} entries, {logged_suspicious} suspicious, "
+                  f"lag {lag_ms.value} ms, last batch max reconstruction error {reconstruction_errors.max():.4f} "
+                  f"(threshold {threshold}){cache_info}")
+            logged_rows = logged_suspicious = 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score the Redis stream using only the saved model artifacts')
+    parser.add_argument('--model_path', default=model_path)
+    parser.add_argument('--scaler_path', default=scaler_path)
+    parser.add_argument('--threshold_path', default=threshold_path)
+    parser.add_argument('--features_path', default=features_path)
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='keras',
+                        help='numpy scores with the weights exported by numpy_model.py, without TensorFlow')
+    parser.add_argument('--weights_path', default=weights_path)
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64', help='Precision of the numpy engine')
+    parser.add_argument('--redis_host', default='localhost')
+    parser.add_argument('--redis_port', type=int, default=6379)
+    parser.add_argument('--record_format', choices=['text', 'packed'], default='text',
+                        help='packed also accepts binary records from network_logger --record_format packed')
+    parser.add_argument('--batch_size', type=int, default=64, help='Max stream entries scored per forward pass')
+    parser.add_argument('--max_latency_ms', type=int, default=50, help='Max wait for a batch to fill once its first entry arrives')
+    parser.add_argument('--ring_path', default=ring_path, help="Memory-mapped history of scored records, '' to turn it off")
+    parser.add_argument('--ring_capacity', type=int, default=100000)
+    parser.add_argument('--cache_size', type=int, default=65536, help='Reconstruction errors kept for repeated rows, 0 to turn the cache off')
+    parser.add_argument('--cache_quantum', type=float, default=0.0, help='Round scaled features to this step for cache keys, 0 for exact matches')
+    parser.add_argument('--metrics_port', type=int, default=0, help='Serve Prometheus metrics on this local port, 0 to turn it off')
+    parser.add_argument('--metrics_file', default=None, help='Also write the metrics to this file every few seconds')
+    parser.add_argument('--log_interval', type=float, default=10.0, help='Seconds between summary lines')
+    parser.add_argument('--recalibrate_interval', type=float, default=0.0,
+                        help='Seconds between threshold recalibrations from the scored errors, 0 to keep the saved threshold')
+    parser.add_argument('--threshold_quantile', type=float, default=0.999, help='Quantile of the reconstruction errors used as threshold')
+    parser.add_argument('--threshold_window', type=int, default=1000000, help='Rows after which older errors start to age out, 0 to keep all')
+    parser.add_argument('--threshold_min_count', type=int, default=1000, help='Rows needed before a threshold is recalibrated')
+    parser.add_argument('--threshold_group_by', default='', help="Comma separated fields with their own threshold, e.g. 'protocol_type,service'")
+    parser.add_argument('--threshold_sketch_path', default=sketch_path, help='Where the quantile sketches are kept between runs')
+    parser.add_argument('--threshold_max_change', type=float, default=2.0,
+                        help='Recalibrated thresholds stay within this factor of the trained threshold, 0 for no bound')
+    parser.add_argument('--finetune_interval', type=float, default=0.0,
+                        help='Seconds between background fine-tuning rounds on recent normal rows, 0 to turn it off')
+    parser.add_argument('--finetune_rows', type=int, default=100000, help='Size of the reservoir sample of normal rows')
+    parser.add_argument('--finetune_min_rows', type=int, default=10000, help='Sampled rows needed before fine-tuning')
+    parser.add_argument('--finetune_epochs', type=int, default=3)
+    parser.add_argument('--finetune_batch_size', type=int, default=1024)
+    parser.add_argument('--finetune_lr', type=float, default=1e-4)
+    parser.add_argument('--keep_scaler', action='store_true', help='Fine-tune with the loaded scaler instead of refitting it on the sample')
+    parser.add_argument('--finetune_save', action='store_true', help='Overwrite the saved artifacts with every fine-tuned version')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.features_path):
+        parser.error(f"{args.features_path} not found, run main.py once to write the feature schema")
+    if args.engine == 'numpy' and not os.path.exists(args.weights_path):
+        parser.error(f"{args.weights_path} not found, run numpy_model.py to export the model weights")
+
+    model, standard_scaler, threshold, feature_columns = load_artifacts(
+        args.model_path, args.scaler_path, args.threshold_path, args.features_path,
+        args.engine, args.weights_path, args.dtype)
+
+    r = redis_client(args.redis_host, args.redis_port, args.record_format)
+    ring = open_ring(args.ring_path, feature_columns, args.ring_capacity)
+    cache = open_cache(args.cache_size, args.cache_quantum, args.engine, args.model_path, args.weights_path,
+                       args.scaler_path)
+    calibrator = open_calibrator(threshold, args.recalibrate_interval, args.threshold_quantile, args.threshold_window,
+                                 args.threshold_min_count, args.threshold_group_by, args.threshold_path,
+                                 args.threshold_sketch_path, args.threshold_max_change)
+    tuner = None
+    if args.finetune_interval > 0:
+        # Training needs the Keras model, the numpy engine only scores
+        keras_model = model if args.engine == 'keras' else load_model(args.model_path)
+        tuner = open_tuner(args.finetune_interval, keras_model, model, standard_scaler, threshold, feature_columns,
+                           args.engine, args.dtype, args.finetune_rows, args.finetune_min_rows, args.finetune_epochs,
+                           args.finetune_batch_size, args.finetune_lr, not args.keep_scaler, args.finetune_save,
+                           args.model_path, args.scaler_path, args.threshold_path, args.weights_path)
+    registry = metrics.Registry()
+    exporter = metrics.Exporter(registry, args.metrics_port, args.metrics_file)
+    try:
+        consume(r, model, standard_scaler, threshold, feature_columns, args.batch_size, args.max_latency_ms, ring,
+                cache, record_decoder(r, args.record_format), registry, exporter, args.log_interval,
+                calibrator=calibrator, tuner=tuner)
+    finally:
+        if ring is not None:
+            ring.close()
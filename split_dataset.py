@@ -0,0 +1,140 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import time
+from preprocess import kdd_main_classes
+
+output_classes = ('normal', 'suspicious', 'dos', 'probe', 'r2l', 'u2r', 'unknown')
+
+
+def label_classes(raw_label, normal=None):
+    """
+    Output classes of a raw label such as b'smurf.': normal, or suspicious
+    plus its main class. A row is normal when its label is 'normal.' in any
+    case, as classifier.py matched it, unless `normal` says otherwise.
+    """
+    if normal is None:
+        normal = raw_label.strip().lower() == b'normal.'
+    if normal:
+        return ('normal',)
+    main_class = kdd_main_classes.get(raw_label.strip().decode('ascii', 'replace').lower().rstrip('.'), 'unknown')
+    # e.g. 'normal' without the dot, suspicious rows never go to the normal output
+    return ('suspicious', 'unknown' if main_class == 'normal' else main_class)
+
+def line_ranges(input_path, chunk_bytes):
+    """Split a file into byte ranges of about chunk_bytes that each end on a newline."""
+    size = os.path.getsize(input_path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n', min(start + chunk_bytes, size) - 1)
+            end = size if end == -1 else end + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def _split_range(task):
+    input_path, start, end, names, strip_label, normal_suffix = task
+    with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chunk = data[start:end]
+    if b'\r' in chunk:
+        # Text mode reads of the old scripts also ended lines at a lone '\r'
+        chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+    lines = {name: [] for name in names}
+    # Raw label -> appends of the outputs it goes to, labels are only decoded once per distinct value
+    targets = {}
+    label_counts = {}
+    for line in chunk.split(b'\n'):
+        line = line.strip()
+        if not line:
+            continue
+        # Without a comma the whole line is the label and the stripped row is empty
+        comma = line.rfind(b',')
+        raw_label = line[comma + 1:]
+        key = raw_label if normal_suffix is None else (raw_label, line.endswith(normal_suffix))
+        appends = targets.get(key)
+        if appends is None:
+            classes = label_classes(raw_label) if normal_suffix is None else label_classes(raw_label, key[1])
+            appends = targets[key] = [lines[name].append for name in classes if name in lines]
+            label_counts[key] = [classes, 0]
+        label_counts[key][1] += 1
+        row = (line[:comma] if comma >= 0 else b'') if strip_label else line
+        for append in appends:
+            append(row)
+
+    counts = dict.fromkeys(output_classes, 0)
+    for classes, count in label_counts.values():
+        for name in classes:
+            counts[name] += count
+    blobs = {name: b'\n'.join(rows) + b'\n' if rows else b'' for name, rows in lines.items()}
+    return counts, blobs
+
+def split_dataset(input_path, outputs, strip_label=False, workers=None, chunk_bytes=32 * 1024 * 1024,
+                  normal_suffix=None):
+    """
+    Split a KDD file by label into the files in `outputs` (class name -> path,
+    see output_classes). Newline-aligned byte ranges of the memory-mapped
+    input are handled by a pool of processes and written back in input
+    order. Returns the row count of every class, written or not.
+
+    Rows are whitespace-stripped and blank lines skipped, like the old
+    split scripts did. With normal_suffix (bytes) a row is normal when the
+    stripped line ends with it, case-sensitive, as filter_non_normal.py
+    matched rows; otherwise see label_classes.
+    """
+    unknown = set(outputs) - set(output_classes)
+    if unknown:
+        raise ValueError(f"Unknown output classes {sorted(unknown)}, expected some of {output_classes}")
+    for path in outputs.values():
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    names = tuple(outputs)
+    tasks = [(input_path, start, end, names, strip_label, normal_suffix) for start, end in line_ranges(input_path, chunk_bytes)]
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+
+    counts = dict.fromkeys(output_classes, 0)
+    files = {name: open(path, 'wb') for name, path in outputs.items()}
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap(_split_range, tasks) if pool is not None else map(_split_range, tasks)
+        for part_counts, blobs in results:
+            for name, count in part_counts.items():
+                counts[name] += count
+            for name, blob in blobs.items():
+                files[name].write(blob)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for out in files.values():
+            out.close()
+    return counts
+
+def print_counts(counts, seconds=None, input_path=None):
+    for name in output_classes:
+        print(f"{name:<12}{counts[name]:>12}")
+    if seconds is not None and input_path is not None:
+        size_mb = os.path.getsize(input_path) / (1024 * 1024)
+        print(f"{size_mb:.1f} MB in {seconds:.2f}s ({size_mb / max(seconds, 1e-9):.1f} MB/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split a KDD file into normal, suspicious and per-main-class files')
+    parser.add_argument('--input_file', required=True)
+    parser.add_argument('--output_dir', default='split', help='Where <class>.txt files are written')
+    parser.add_argument('--classes', default='normal,suspicious,dos,probe,r2l,u2r',
+                        help=f"Comma separated outputs to write, out of {','.join(output_classes)}")
+    parser.add_argument('--strip_label', action='store_true', help='Drop the label column from the written rows')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to the CPU count')
+    parser.add_argument('--chunk_mb', type=int, default=32, help='Size of the byte range handled per task')
+    args = parser.parse_args()
+
+    outputs = {name: os.path.join(args.output_dir, f'{name}.txt') for name in args.classes.split(',') if name}
+    start = time.time()
+    counts = split_dataset(args.input_file, outputs, args.strip_label, args.workers, args.chunk_mb * 1024 * 1024)
+    print_counts(counts, time.time() - start, args.input_file)
@@ -0,0 +1,167 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+import joblib
+import numpy as np
+from sklearn.model_selection import train_test_split
+import kdd_loader
+import preprocess
+import serve
+
+
+def prepare_data(args):
+    """
+    Load, prune and scale the training set once, and save the train/validation
+    split as .npy files the workers memory-map instead of reparsing the CSV.
+    """
+    x_normal, numeric_columns = kdd_loader.load_normal_numeric(args.data_path, args.cache_dir, args.chunksize)
+    stats = preprocess.StreamingStats.from_chunks(
+        (x_normal[start:start + args.chunksize] for start in range(0, len(x_normal), args.chunksize)),
+        numeric_columns)
+    dropped_cols = stats.correlated_columns(threshold=args.correlation_value)
+    feature_columns = [col for col in numeric_columns if col not in dropped_cols]
+    standard_scaler = stats.standard_scaler(feature_columns)
+    feature_index = [numeric_columns.index(col) for col in feature_columns]
+    x_scaled = standard_scaler.transform(x_normal[:, feature_index])
+
+    train_X, valid_X = train_test_split(x_scaled, test_size=0.25, random_state=1)
+    paths = {'train': os.path.join(args.sweep_dir, 'train.npy'), 'valid': os.path.join(args.sweep_dir, 'valid.npy')}
+    np.save(paths['train'], train_X)
+    np.save(paths['valid'], valid_X)
+
+    # Shared by every configuration, so any of them can be served from the sweep directory
+    joblib.dump(standard_scaler, os.path.join(args.sweep_dir, 'scaler.pkl'))
+    serve.save_feature_schema(feature_columns, dropped_cols, os.path.join(args.sweep_dir, 'features.json'))
+    return paths, len(feature_columns)
+
+def configurations(args):
+    grid = [dict(archi=archi, regu=regu, dropout=dropout, l1_value=l1, l2_value=l2, loss=loss)
+            for archi, regu, dropout, l1, l2, loss in itertools.product(
+                args.archis.split(';'), args.regus.split(','), [float(v) for v in args.dropouts.split(',')],
+                [float(v) for v in args.l1_values.split(',')], [float(v) for v in args.l2_values.split(',')],
+                args.losses.split(','))]
+    if args.samples and args.samples < len(grid):
+        grid = random.Random(args.seed).sample(grid, args.samples)
+    return grid
+
+def measure_latency(predict, rows, repeats=20):
+    predict(rows[:1])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(rows[:1])
+    single = (time.perf_counter() - start) / repeats
+    start = time.perf_counter()
+    predict(rows)
+    batch = time.perf_counter() - start
+    return single * 1000, len(rows) / batch
+
+def train_config(task):
+    index, config, paths, args = task
+    import tensorflow as tf
+    import autoencoder
+    import numpy_model
+
+    tf.config.threading.set_intra_op_parallelism_threads(args.threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    tf.keras.utils.set_random_seed(args.seed + index)
+
+    train_X = np.load(paths['train'], mmap_mode='r')
+    valid_X = np.load(paths['valid'], mmap_mode='r')
+    config_dir = os.path.join(args.sweep_dir, f'config_{index:03d}')
+    os.makedirs(config_dir, exist_ok=True)
+
+    start = time.time()
+    wrapper = autoencoder.Autoencoder(num_features=train_X.shape[1], archi=config['archi'], reg=config['regu'],
+                                      l1_value=config['l1_value'], l2_value=config['l2_value'],
+                                      dropout=config['dropout'], loss=config['loss'], verbose=False)
+    history = wrapper.train(train_X, valid_X, epochs=args.epochs, batch_size=args.batch_size, verbose=0)
+    train_seconds = time.time() - start
+
+    reconstruction_errors = np.mean(np.square(train_X - wrapper.model.predict(train_X, verbose=0)), axis=1)
+    threshold = float(np.mean(reconstruction_errors) + 3 * np.std(reconstruction_errors))
+    # val_loss depends on the configured loss and includes the l1/l2 penalties, so it can't rank configurations
+    valid_mse = float(np.mean(np.square(valid_X - wrapper.model.predict(valid_X, verbose=0))))
+
+    wrapper.model.save(os.path.join(config_dir, 'saved_model.h5'))
+    weights_file = numpy_model.export_weights(wrapper.model, os.path.join(config_dir, 'model_weights.npz'))
+    with open(os.path.join(config_dir, 'threshold.json'), 'w') as f:
+        json.dump({'threshold': threshold}, f)
+
+    engine = numpy_model.NumpyAutoencoder.load(weights_file)
+    sample = np.asarray(valid_X[:args.latency_rows])
+    numpy_ms, numpy_rows_per_sec = measure_latency(engine.predict, sample)
+    keras_ms, keras_rows_per_sec = measure_latency(wrapper.model.predict_on_batch, sample)
+
+    result = dict(config, index=index, directory=config_dir, epochs_run=len(history.history['val_loss']),
+                  valid_mse=valid_mse, val_loss=float(np.min(history.history['val_loss'])), threshold=threshold,
+                  parameters=int(wrapper.model.count_params()), train_seconds=train_seconds,
+                  numpy_row_ms=numpy_ms, numpy_rows_per_sec=numpy_rows_per_sec,
+                  keras_row_ms=keras_ms, keras_rows_per_sec=keras_rows_per_sec)
+    with open(os.path.join(config_dir, 'result.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+def rank_results(results):
+    """Best first, by the plain validation reconstruction MSE every configuration is measured with."""
+    return sorted(results, key=lambda result: result['valid_mse'])
+
+def print_results(results):
+    print(f"{'#':>4} {'archi':<28}{'regu':<6}{'loss':<6}{'drop':>6}{'valid mse':>12}{'params':>9}"
+          f"{'threshold':>12}{'np 1-row ms':>13}{'np rows/s':>12}")
+    for result in rank_results(results):
+        print(f"{result['index']:>4} {result['archi']:<28}{result['regu']:<6}{result['loss']:<6}{result['dropout']:>6.2f}"
+              f"{result['valid_mse']:>12.5f}{result['parameters']:>9}{result['threshold']:>12.4f}"
+              f"{result['numpy_row_ms']:>13.3f}{result['numpy_rows_per_sec']:>12.0f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train Autoencoder configurations in parallel on one shared, scaled dataset')
+    parser.add_argument('--data_path', required=True)
+    parser.add_argument('--cache_dir', default='cache')
+    parser.add_argument('--chunksize', type=int, default=200000)
+    parser.add_argument('--correlation_value', type=float, default=0.9)
+    parser.add_argument('--sweep_dir', default='sweep', help='Where the shared data, models and results are written')
+    parser.add_argument('--archis', default='U20,D,U15,D,U10,D,U15,D,U20;U16,D,U8,D,U16;U32,D,U16,D,U32',
+                        help='Semicolon separated architectures')
+    parser.add_argument('--regus', default='l1l2')
+    parser.add_argument('--dropouts', default='0.1')
+    parser.add_argument('--l1_values', default='0.0001')
+    parser.add_argument('--l2_values', default='0.0001')
+    parser.add_argument('--losses', default='mse')
+    parser.add_argument('--samples', type=int, default=0, help='Train a random sample of this many configurations, 0 for the full grid')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch_size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--threads_per_worker', type=int, default=2)
+    parser.add_argument('--latency_rows', type=int, default=4096, help='Validation rows used to measure inference speed')
+    args = parser.parse_args()
+
+    os.makedirs(args.sweep_dir, exist_ok=True)
+    start = time.time()
+    paths, num_features = prepare_data(args)
+    grid = configurations(args)
+    print(f"Prepared {num_features} features in {time.time() - start:.1f}s, training {len(grid)} configurations "
+          f"on {args.workers} workers x {args.threads_per_worker} threads")
+
+    serve.limit_threads(args.threads_per_worker)
+
+    results = []
+    tasks = [(index, config, paths, args) for index, config in enumerate(grid)]
+    context = multiprocessing.get_context('spawn')
+    # One configuration per process, so TensorFlow memory is released between them
+    with context.Pool(args.workers, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(train_config, tasks):
+            results.append(result)
+            print(f"[{len(results)}/{len(grid)}] config {result['index']} {result['archi']}: "
+                  f"valid mse {result['valid_mse']:.5f}, {result['parameters']} parameters, "
+                  f"{result['numpy_row_ms']:.3f} ms/row")
+
+    with open(os.path.join(args.sweep_dir, 'results.json'), 'w') as f:
+        json.dump(rank_results(results), f, indent=2)
+    print_results(results)
+    print(f"Sweep finished in {time.time() - start:.1f}s, results in {os.path.join(args.sweep_dir, 'results.json')}")
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+import metrics
+import serve
+import workers
+from local_redis import LocalRedis
+
+stream = 'network_logs'
+feature_columns = ['col0', 'col4', 'col5']
+
+
+class MeanModel:
+    def predict_on_batch(self, rows):
+        return np.zeros_like(rows)
+
+def entry(i):
+    return {'duration': i, 'protocol_type': 'tcp', 'service': 'http', 'flag': 'SF', 'src_bytes': 100 + i,
+            'dst_bytes': 10 * i}
+
+def test_backlog_counts_unread_entries():
+    r = LocalRedis()
+    for i in range(5):
+        r.xadd(stream, entry(i))
+    backlog = serve.StreamBacklog(r, stream)
+    last_id = backlog.start_id
+    assert backlog.update(r.xinfo_stream(stream), last_id) == 0
+
+    for i in range(10):
+        r.xadd(stream, entry(i))
+    entries, last_id = serve.read_batch(r, last_id, 4, 0)
+    backlog.read += len(entries)
+    assert backlog.update(r.xinfo_stream(stream), last_id) == 6
+
+    # Trimmed before they were read, then caught up: nothing is left waiting
+    for i in range(20):
+        r.xadd(stream, entry(i), maxlen=8)
+    assert backlog.update(r.xinfo_stream(stream), last_id) == 8
+    while True:
+        entries, last_id = serve.read_batch(r, last_id, 64, 0)
+        backlog.read += len(entries)
+        if not entries:
+            break
+    assert backlog.update(r.xinfo_stream(stream), last_id) == 0
+    r.xadd(stream, entry(0))
+    assert backlog.update(r.xinfo_stream(stream), last_id) == 1
+
+def test_worker_batches_are_instrumented():
+    fakeredis = pytest.importorskip('fakeredis')
+    r = fakeredis.FakeRedis(decode_responses=True)
+    workers.ensure_group(r, stream, workers.group_name)
+    for i in range(30):
+        r.xadd(stream, entry(i))
+
+    registry = metrics.Registry()
+    instruments = serve.consumer_metrics(registry)
+    rows = serve.build_feature_matrix([entry(i) for i in range(30)], feature_columns)
+    standard_scaler = StandardScaler().fit(rows)
+    messages = workers.read_group_batch(r, 'worker-0', 20, 0, stream)
+    workers.process_messages(r, messages, MeanModel(), standard_scaler, 1.0, feature_columns, stream,
+                             instruments=instruments)
+
+    stages, batch_rows, rows_scored, rows_suspicious = instruments
+    assert rows_scored.value == 20
+    assert all(sum(stage.counts) == 1 for stage in stages[1:])
+    assert 0 < rows_suspicious.value < 20
+    lag, pending = workers.group_backlog(r, stream, workers.group_name)
+    assert (lag, pending) == (10, 0)
+    assert 'hackbyte_consumer_stage_seconds_count{stage="persist"} 1' in registry.render()
@@ -0,0 +1,15 @@
+import kdd_loader
+
+row = '0,tcp,http,SF,{},0,0,0,0,0,0,1,0,0,0,0,0,0,0,0,0,0,1,1,0.0,0.0,0.0,0.0,1.0,0.0,0.0,10,10,1.0,0.0,0.1,0.0,0.0,0.0,0.0,0.0,normal.\n'
+
+
+def test_same_size_edit_invalidates_cache(tmp_path):
+    data_path = tmp_path / 'kdd.txt'
+    data_path.write_text(''.join(row.format(100 + i) for i in range(2000)))
+    matrix, _ = kdd_loader.load_normal_numeric(str(data_path), str(tmp_path / 'cache'), verbose=False)
+    assert matrix[1000, 0] == 1100
+
+    # Same length, changed in the middle of the file
+    data_path.write_text(''.join(row.format(100 + i if i != 1000 else 999) for i in range(2000)))
+    matrix, _ = kdd_loader.load_normal_numeric(str(data_path), str(tmp_path / 'cache'), verbose=False)
+    assert matrix[1000, 0] == 999
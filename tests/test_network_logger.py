@@ -0,0 +1,35 @@
+import network_logger
+from flow_table import FlowTable, PacketInfo, TCP_ACK, TCP_FIN, TCP_SYN
+from window_stats import HostWindowStats, TimeWindowStats
+
+
+def test_expired_syn_flood_counts_in_time_window(monkeypatch):
+    monkeypatch.setattr(network_logger, 'flow_table', FlowTable(idle_timeout=15))
+    monkeypatch.setattr(network_logger, 'time_window_stats', TimeWindowStats(2))
+    monkeypatch.setattr(network_logger, 'host_window_stats', HostWindowStats(100))
+
+    # 2400 half-open connections to one host:port within 1.2s, none ever closes
+    records = []
+    last_expire = 1000.0
+    for i in range(2400):
+        now = 1000.0 + i * 0.0005
+        records.append(network_logger.extract_features(
+            PacketInfo(now, '10.0.0.9', '10.0.0.1', 'tcp', 10000 + i, 80, 60, 0, TCP_SYN)))
+    assert not any(records)
+    # Flushed once a second like the capture loop, while other connections keep closing
+    records = []
+    for second in range(1, 30):
+        now = last_expire + second
+        client, server = ('10.0.0.7', 5000 + second), ('10.0.0.2', 443)
+        for src, dst, flags in ((client, server, TCP_SYN), (server, client, TCP_SYN | TCP_ACK),
+                                (client, server, TCP_FIN | TCP_ACK), (server, client, TCP_FIN | TCP_ACK)):
+            network_logger.extract_features(PacketInfo(now, src[0], dst[0], 'tcp', src[1], dst[1], 60, 0, flags))
+        records += [record for record in network_logger.flush_flows(now) if record['flag'] == 'S0']
+
+    assert len(records) == 2400
+    last = records[-1]
+    assert last['count'] > 1000
+    assert last['srv_count'] > 1000
+    assert last['serror_rate'] == 1.0
+    assert last['srv_serror_rate'] == 1.0
+    assert last['dst_host_serror_rate'] == 1.0
@@ -0,0 +1,46 @@
+import os
+import numpy as np
+import pytest
+import benchmark
+import serve
+from numpy_model import NumpyAutoencoder
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def artifact(name):
+    return os.path.join(root, name)
+
+@pytest.fixture(scope='module')
+def scaled_rows():
+    # Captured traffic, scaled with the committed scaler and feature schema
+    _, standard_scaler, threshold, feature_columns = serve.load_artifacts(
+        artifact(serve.model_path), artifact(serve.scaler_path), artifact(serve.threshold_path),
+        artifact(serve.features_path), engine='numpy', weights_file=artifact('model_weights.npz'))
+    entries = benchmark.load_rows(artifact('pyshark_network_log.txt'), 7578)
+    rows = standard_scaler.transform(serve.build_feature_matrix(entries, feature_columns))
+    return rows, threshold
+
+def test_weights_match_feature_schema():
+    engine = NumpyAutoencoder.load(artifact('model_weights.npz'))
+    assert engine.num_features == len(serve.load_feature_schema(artifact(serve.features_path)))
+
+@pytest.mark.parametrize('dtype, rtol', [('float64', 1e-5), ('float32', 1e-3)])
+def test_numpy_engine_matches_keras(scaled_rows, dtype, rtol):
+    pytest.importorskip('tensorflow')
+    rows, threshold = scaled_rows
+    keras_model = serve.load_model(artifact(serve.model_path))
+    engine = NumpyAutoencoder.load(artifact('model_weights.npz'), dtype=dtype)
+
+    keras_errors = np.mean(np.square(rows - keras_model.predict(rows, verbose=0)), axis=1)
+    numpy_errors = engine.reconstruction_error(rows)
+    np.testing.assert_allclose(numpy_errors, keras_errors, rtol=rtol, atol=1e-9)
+    np.testing.assert_allclose(engine.predict(rows[:1]), keras_model.predict_on_batch(rows[:1]), rtol=rtol, atol=1e-6)
+    assert np.array_equal(numpy_errors >= threshold, keras_errors >= threshold)
+
+def test_from_keras_matches_export(scaled_rows):
+    pytest.importorskip('tensorflow')
+    rows, _ = scaled_rows
+    keras_model = serve.load_model(artifact(serve.model_path))
+    exported = NumpyAutoencoder.load(artifact('model_weights.npz'))
+    np.testing.assert_array_equal(NumpyAutoencoder.from_keras(keras_model).predict(rows), exported.predict(rows))
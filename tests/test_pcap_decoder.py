@@ -0,0 +1,37 @@
+import socket
+import struct
+from flow_table import FlowTable
+from pcap_decoder import LINKTYPE_ETHERNET, PacketDecoder
+
+
+def ipv4_frame(ident, flags_fragment, payload, src='10.0.0.1', dst='10.0.0.2', protocol=17):
+    header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), ident, flags_fragment, 64, protocol, 0,
+                         socket.inet_aton(src), socket.inet_aton(dst))
+    return b'\x00' * 12 + b'\x08\x00' + header + payload
+
+def decode(decoder, frame, timestamp=1.0):
+    return decoder.decode(frame, 0, len(frame), timestamp, len(frame))
+
+def test_later_fragments_count_against_their_flow():
+    decoder = PacketDecoder(LINKTYPE_ETHERNET, reuse=False)
+    table = FlowTable()
+    first = ipv4_frame(7, 0x2000, struct.pack('!HHHH', 5353, 53, 1488, 0) + b'x' * 1472)
+    middle = ipv4_frame(7, 0x2000 | 185, b'x' * 1480)
+    last = ipv4_frame(7, 370, b'x' * 100)
+
+    infos = [decode(decoder, frame, t) for t, frame in enumerate((first, middle, last))]
+    assert [(info.sport, info.dport, info.frag_offset) for info in infos] == [(5353, 53, 0), (5353, 53, 185), (5353, 53, 370)]
+    assert not decoder.fragments
+
+    for info in infos:
+        table.update(info)
+    flow, = table.flows.values()
+    assert flow.packets == 3
+    assert flow.wrong_fragment == 2
+
+def test_fragment_without_first_is_dropped():
+    decoder = PacketDecoder(LINKTYPE_ETHERNET, reuse=False)
+    assert decode(decoder, ipv4_frame(8, 185, b'x' * 100)) is None
+    # Same id from another source is a different datagram
+    decode(decoder, ipv4_frame(9, 0x2000, struct.pack('!HH', 1000, 80) + b'x' * 20, protocol=6))
+    assert decode(decoder, ipv4_frame(9, 185, b'x' * 10, src='10.0.0.3', protocol=6)) is None
@@ -0,0 +1,88 @@
+import multiprocessing
+import numpy as np
+import pytest
+import results_ring
+from results_ring import ResultsRing
+
+num_features = 4
+capacity = 5000
+writers = 4
+batches = 200
+batch_rows = 16
+
+
+def check_records(records):
+    # Every feature of a record holds its error value, a torn record would mix two of them
+    assert np.all(np.diff(records['seq'].astype(np.int64)) == 1)
+    assert np.all(records['features'] == records['error'][:, None].astype(np.float32))
+
+def write_batches(path, writer):
+    # Each writer opens the ring itself, resetting reserved while the others append
+    ring = ResultsRing.create(path, num_features, capacity)
+    for batch in range(batches):
+        values = (writer * batches + batch) * batch_rows + np.arange(batch_rows, dtype=np.float64)
+        verdicts = np.where(values % 3 == 0, 'S', 'N')
+        ring.append(verdicts, values, np.repeat(values[:, None], num_features, axis=1))
+    ring.close()
+
+def read_while_writing(path, done):
+    ring = ResultsRing.open(path)
+    seq = 0
+    while not done.is_set():
+        records = ring.since(seq)
+        if len(records):
+            check_records(records)
+            seq = int(records['seq'][-1]) + 1
+        check_records(ring.latest(capacity))
+    ring.close()
+
+
+@pytest.mark.skipif(results_ring.fcntl is None, reason='concurrent writers need fcntl')
+def test_concurrent_writers_and_reader(tmp_path):
+    path = str(tmp_path / 'ring.bin')
+    ResultsRing.create(path, num_features, capacity).close()
+
+    context = multiprocessing.get_context('fork')
+    done = context.Event()
+    reader = context.Process(target=read_while_writing, args=(path, done))
+    reader.start()
+    processes = [context.Process(target=write_batches, args=(path, writer)) for writer in range(writers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    done.set()
+    reader.join()
+    assert [process.exitcode for process in processes] == [0] * writers
+    assert reader.exitcode == 0
+
+    ring = ResultsRing.open(path)
+    total = writers * batches * batch_rows
+    counters = ring.counters()
+    assert counters['records'] == total
+    assert int(ring.header['reserved'][0]) == total
+    suspicious = len(range(0, total, 3))
+    assert counters['total_suspicious'] == suspicious
+    assert counters['total_normal'] == total - suspicious
+
+    records = ring.since(0)
+    assert len(records) == capacity
+    assert records['seq'][0] == total - capacity
+    check_records(records)
+    # Batches stay whole and no value is written twice
+    assert len(np.unique(records['error'])) == capacity
+    assert counters['window_suspicious'] == int(np.sum(records['verdict'] == b'S'))
+    assert counters['window_normal'] == int(np.sum(records['verdict'] == b'N'))
+
+def test_single_writer_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr(results_ring, 'fcntl', None)
+    path = str(tmp_path / 'ring.bin')
+    ring = ResultsRing.create(path, num_features, 100)
+    with pytest.raises(RuntimeError):
+        ResultsRing.create(path, num_features, 100)
+    ring.append(['N'], [1.0], np.ones((1, num_features)))
+    ring.close()
+
+    ring = ResultsRing.create(path, num_features, 100)
+    assert ring.counters()['records'] == 1
+    ring.close()
@@ -0,0 +1,23 @@
+import numpy as np
+from score_file import parse_features
+from serve import build_feature_matrix
+
+fields = ['duration', 'protocol_type', 'service', 'flag', 'src_bytes', 'dst_bytes']
+
+
+def test_empty_fields_are_zero_on_both_paths():
+    expected = np.array([[1.0, 0.0, 3.0], [4.0, 5.0, 0.0], [0.0, 0.0, 0.0]])
+    # Typed fast path
+    assert np.array_equal(parse_features(b'1,,3\n4,5,\n,,nan\n', [0, 1, 2]), expected)
+    # A non-numeric field falls back to coercion
+    assert np.array_equal(parse_features(b'1,,3\n4,5,x\n,,nan\n', [0, 1, 2]), expected)
+
+def test_stream_and_file_parsing_agree():
+    # The first row alone takes the stream's typed path, the empty field of the second its coercion
+    rows = [['0', 'tcp', 'http', 'SF', '181', 'nan'], ['2', 'udp', 'private', 'SF', '', '7']]
+    for batch in (rows[:1], rows):
+        entries = [dict(zip(fields, row)) for row in batch]
+        data = b'\n'.join(','.join(row).encode() for row in batch)
+        expected = parse_features(data, [0, 4, 5])
+        assert not np.isnan(expected).any()
+        assert np.array_equal(build_feature_matrix(entries, ['col0', 'col4', 'col5']), expected)
@@ -0,0 +1,67 @@
+import split_dataset
+from filter_non_normal import filter_non_normal_records
+
+# Mixed case, missing dots, no comma, blank and padded lines, CRLF and 'abnormal.'
+fixture = (
+    '0,tcp,http,SF,181,5450,normal.\n'
+    '0,udp,private,SF,105,146,NORMAL.\r\n'
+    '0,icmp,ecr_i,SF,1032,0,smurf.\n'
+    '\n'
+    '   0,tcp,http,SF,239,486,normal.   \n'
+    '0,tcp,private,REJ,0,0,neptune.\n'
+    '0,tcp,http,SF,1,2,normal\n'
+    '0,tcp,http,SF,1,2,Normal.\n'
+    'normal.\n'
+    'garbage\n'
+    '  \t \n'
+    '0,tcp,telnet,SF,0,0,abnormal.\n'
+    '0,tcp,ftp,SF,10,20,guess_passwd. \n'
+    '0,tcp,http,SF,1,2,normal.\n'
+)
+
+
+def old_classifier(input_file, normal_file, sus_file):
+    # classifier.py before the splitter
+    with open(input_file, "r") as infile, open(normal_file, "w") as normal_out, open(sus_file, "w") as sus_out:
+        for line in infile:
+            line = line.strip()
+            if not line:
+                continue
+            parts = line.split(',')
+            label = parts[-1].strip().lower()
+            if label == "normal.":
+                normal_out.write(','.join(parts[:-1]) + '\n')
+            else:
+                sus_out.write(','.join(parts[:-1]) + '\n')
+
+def old_filter(input_file, output_file):
+    # filter_non_normal.py before the splitter
+    with open(input_file, 'r') as infile, open(output_file, 'w') as outfile:
+        for line in infile:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.endswith('normal.'):
+                outfile.write(line + '\n')
+
+
+def test_classifier_matches_old_script(tmp_path):
+    data_path = tmp_path / 'kdd.txt'
+    data_path.write_bytes(fixture.encode() * 50)
+    old_classifier(data_path, tmp_path / 'old_normal.txt', tmp_path / 'old_sus.txt')
+    for workers, chunk_bytes in ((1, 1 << 20), (3, 200)):
+        counts = split_dataset.split_dataset(str(data_path), {'normal': str(tmp_path / 'normal.txt'),
+                                                              'suspicious': str(tmp_path / 'sus.txt')},
+                                             strip_label=True, workers=workers, chunk_bytes=chunk_bytes)
+        assert (tmp_path / 'normal.txt').read_bytes() == (tmp_path / 'old_normal.txt').read_bytes()
+        assert (tmp_path / 'sus.txt').read_bytes() == (tmp_path / 'old_sus.txt').read_bytes()
+        assert counts['normal'] == 50 * 6
+        assert counts['suspicious'] == 50 * 6
+
+def test_filter_matches_old_script(tmp_path):
+    data_path = tmp_path / 'kdd.txt'
+    data_path.write_bytes(fixture.encode() * 50)
+    old_filter(data_path, tmp_path / 'old_sus.txt')
+    count = filter_non_normal_records(str(data_path), str(tmp_path / 'sus.txt'))
+    assert (tmp_path / 'sus.txt').read_bytes() == (tmp_path / 'old_sus.txt').read_bytes()
+    assert count == 50 * 7
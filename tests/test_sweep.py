@@ -0,0 +1,34 @@
+import argparse
+import multiprocessing
+import os
+import numpy as np
+import pytest
+import sweep
+from numpy_model import NumpyAutoencoder
+
+
+def test_configurations_ranked_by_plain_validation_mse(tmp_path):
+    pytest.importorskip('tensorflow')
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(800, 3))
+    x = np.hstack([base, base * 0.5 + rng.normal(scale=0.1, size=base.shape)])
+    paths = {'train': str(tmp_path / 'train.npy'), 'valid': str(tmp_path / 'valid.npy')}
+    np.save(paths['train'], x[:600])
+    np.save(paths['valid'], x[600:])
+    args = argparse.Namespace(threads_per_worker=1, seed=1, sweep_dir=str(tmp_path), epochs=3, batch_size=64,
+                              latency_rows=32)
+    # Different losses and penalties, so their val_loss values are not comparable
+    grid = [dict(archi='U4,D,U4', regu='l1l2', dropout=0.1, l1_value=0.01, l2_value=0.01, loss='mae'),
+            dict(archi='U8,U8', regu='l2', dropout=0.0, l1_value=0.0, l2_value=0.0, loss='mse')]
+    tasks = [(index, config, paths, args) for index, config in enumerate(grid)]
+    # TensorFlow threading can only be set before it starts, as in the sweep's own worker processes
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        results = pool.map(sweep.train_config, tasks)
+
+    valid_X = np.load(paths['valid'])
+    for result in results:
+        engine = NumpyAutoencoder.load(os.path.join(result['directory'], 'model_weights.npz'))
+        expected = np.mean(np.square(valid_X - engine.predict(valid_X)))
+        assert result['valid_mse'] == pytest.approx(expected, rel=1e-3)
+    ranked = sweep.rank_results(results)
+    assert [result['valid_mse'] for result in ranked] == sorted(result['valid_mse'] for result in results)
@@ -0,0 +1,98 @@
+import json
+import numpy as np
+import pytest
+from threshold_calibrator import ThresholdCalibrator, load_trained_threshold
+
+fields = ['duration', 'protocol_type', 'service']
+
+
+def benign_errors(rng, rows, scale=1.0):
+    return scale * rng.lognormal(mean=-3.0, sigma=0.5, size=rows)
+
+def trained_threshold(rng):
+    return float(np.quantile(benign_errors(rng, 1000000), 0.999))
+
+def score(calibrator, errors, groups=None, batch_size=512):
+    # As the consumer does: verdicts against the current thresholds, then observe.
+    # Returns the fraction of rows flagged
+    flagged = 0
+    for start in range(0, len(errors), batch_size):
+        batch, batch_groups = errors[start:start + batch_size], None if groups is None else groups[start:start + batch_size]
+        flagged += int(np.sum(batch >= calibrator.row_thresholds(batch_groups)))
+        calibrator.observe(batch, batch_groups)
+    calibrator.update()
+    return flagged / len(errors)
+
+def test_follows_benign_upward_drift():
+    rng = np.random.default_rng(0)
+    trained = trained_threshold(rng)
+    calibrator = ThresholdCalibrator(trained, window=100000, min_count=1000)
+    score(calibrator, benign_errors(rng, 200000))
+    assert calibrator.threshold == pytest.approx(trained, rel=0.03)
+    for _ in range(3):
+        score(calibrator, benign_errors(rng, 100000, 1.5))
+    assert calibrator.threshold == pytest.approx(1.5 * trained, rel=0.03)
+    assert score(calibrator, benign_errors(rng, 100000, 1.5)) < 0.002
+
+def test_recovers_after_quiet_period():
+    rng = np.random.default_rng(1)
+    trained = trained_threshold(rng)
+    calibrator = ThresholdCalibrator(trained, window=100000, min_count=1000)
+    for _ in range(3):
+        score(calibrator, benign_errors(rng, 100000, 0.6))
+    assert calibrator.threshold == pytest.approx(0.6 * trained, rel=0.03)
+    for _ in range(3):
+        score(calibrator, benign_errors(rng, 100000))
+    assert calibrator.threshold == pytest.approx(trained, rel=0.03)
+    assert score(calibrator, benign_errors(rng, 100000)) < 0.002
+
+def test_anomaly_burst_raises_threshold_at_most_to_the_bound():
+    rng = np.random.default_rng(2)
+    trained = trained_threshold(rng)
+    calibrator = ThresholdCalibrator(trained, window=100000, min_count=1000, max_change=2.0)
+    score(calibrator, benign_errors(rng, 200000))
+
+    # 10% of the traffic is an attack far above the threshold
+    for _ in range(3):
+        errors = benign_errors(rng, 100000)
+        attack = rng.random(len(errors)) < 0.1
+        errors[attack] = trained * rng.uniform(5, 50, attack.sum())
+        assert np.quantile(errors, 0.999) > 4 * trained
+        score(calibrator, errors)
+        assert calibrator.threshold <= 2 * trained
+        assert np.all(errors[attack] >= calibrator.threshold)
+
+    # Back to the trained threshold once the burst has aged out
+    for _ in range(3):
+        score(calibrator, benign_errors(rng, 100000))
+    assert calibrator.threshold == pytest.approx(trained, rel=0.03)
+
+def test_anomaly_burst_in_one_group():
+    rng = np.random.default_rng(3)
+    trained = trained_threshold(rng)
+    calibrator = ThresholdCalibrator(trained, window=0, min_count=1000, group_by=['protocol_type'], fields=fields)
+    groups = np.where(rng.random(200000) < 0.5, 'tcp', 'udp').tolist()
+    score(calibrator, benign_errors(rng, 200000), groups)
+    before = dict(calibrator.group_thresholds)
+
+    errors = benign_errors(rng, 200000)
+    groups = np.where(rng.random(200000) < 0.5, 'tcp', 'udp').tolist()
+    errors[np.array(groups) == 'udp'] *= 20
+    score(calibrator, errors, groups)
+    assert calibrator.group_thresholds['udp'] <= 2 * trained
+    assert calibrator.group_thresholds['tcp'] == pytest.approx(before['tcp'], rel=0.03)
+
+def test_threshold_stays_within_max_change(tmp_path):
+    path = str(tmp_path / 'threshold.json')
+    calibrator = ThresholdCalibrator(0.1, path=path, window=0, min_count=100, max_change=2.0)
+    # Traffic the model reconstructs far better than the training data
+    score(calibrator, np.full(10000, 0.001))
+    assert calibrator.threshold == pytest.approx(0.05)
+    with open(path) as f:
+        assert json.load(f)['threshold'] == pytest.approx(0.05)
+    # The bound of the next run is still relative to the trained threshold
+    assert load_trained_threshold(path) == 0.1
+
+    unbounded = ThresholdCalibrator(0.1, window=0, min_count=100, max_change=0)
+    score(unbounded, np.full(10000, 0.001))
+    assert unbounded.threshold == pytest.approx(0.001, rel=0.02)
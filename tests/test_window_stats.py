@@ -0,0 +1,33 @@
+import random
+from window_stats import TimeWindowStats
+
+
+def test_late_connection_outside_window_is_not_counted():
+    stats = TimeWindowStats(2)
+    stats.add(100, 'a', 80)
+    stats.add(85, 'a', 53)
+    stats.add(101.5, 'a', 80)
+    assert stats.features('a', 80)['count'] == 2
+    assert stats.features('a', 53)['srv_count'] == 0
+
+def test_out_of_order_matches_recount():
+    rng = random.Random(0)
+    stats = TimeWindowStats(2)
+    added = []
+    latest = 0.0
+    for i in range(5000):
+        # Mostly increasing timestamps, some reported up to 15s late like idle flows
+        timestamp = i * 0.05 - (rng.random() * 15 if rng.random() < 0.2 else 0)
+        dst, dport = rng.choice('abc'), rng.choice((53, 80, 443))
+        serror, rerror = rng.random() < 0.1, rng.random() < 0.1
+        stats.add(timestamp, dst, dport, serror, rerror)
+        latest = max(latest, timestamp)
+        if latest - timestamp <= 2:
+            added.append((timestamp, dst, dport, serror, rerror))
+        window = [c for c in added if latest - c[0] <= 2]
+
+        count = sum(1 for c in window if c[1] == dst)
+        srv_count = sum(1 for c in window if c[1:3] == (dst, dport))
+        features = stats.features(dst, dport)
+        assert (features['count'], features['srv_count']) == (count, srv_count)
+        assert features['serror_rate'] == (round(sum(c[3] for c in window if c[1] == dst) / count, 2) if count else 0)
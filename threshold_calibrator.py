@@ -0,0 +1,209 @@
+import json
+import os
+import time
+import numpy as np
+from quantile_sketch import QuantileSketch
+
+sketch_path = 'threshold_sketch.json'
+# Sketch key of all rows, group keys are the joined field values, e.g. 'tcp/http'
+overall_key = '*'
+
+
+def write_json_atomic(data, path):
+    # Readers of path see the old or the new file, never a partial one
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_thresholds(path):
+    """(threshold, {group: threshold}) from a threshold.json written by main.py or a calibrator."""
+    with open(path) as f:
+        data = json.load(f)
+    return data['threshold'], data.get('groups', {})
+
+def load_trained_threshold(path):
+    """The threshold the model was trained with, kept in threshold.json next to the recalibrated one."""
+    with open(path) as f:
+        data = json.load(f)
+    return data.get('trained_threshold', data['threshold'])
+
+
+class ThresholdCalibrator:
+    """
+    Recalibrates the anomaly threshold from the reconstruction errors the
+    scorer already computes. Errors go into quantile sketches, one over all
+    rows and, with group_by, one per combination of those fields. Every
+    `interval` seconds each threshold is set to its sketch's `quantile` and
+    the result is written to `path`. Errors are buffered and added to the
+    sketches in bulk, at each update or every flush_rows rows. Each sketch
+    covers the last one to two `window`s of rows, so old traffic ages out;
+    groups with fewer than min_count rows fall back to the overall threshold.
+
+    Thresholds stay within a factor of max_change (0 for no bound) of the
+    trained one, and errors count as at most the highest threshold allowed:
+    an attack, however far out, raises the threshold no further than that,
+    rows past it stay flagged, and once it ages out of the window the
+    threshold follows the remaining traffic again, up or down.
+    """
+
+    def __init__(self, threshold, path=None, quantile=0.999, interval=60.0, window=1000000, min_count=1000,
+                 group_by=(), fields=(), relative_accuracy=0.01, state_path=None, flush_rows=65536,
+                 max_change=2.0, trained_threshold=None):
+        self.threshold = float(threshold)
+        self.trained_threshold = float(threshold if trained_threshold is None else trained_threshold)
+        self.max_change = max_change
+        self.group_thresholds = {}
+        self.path = path
+        self.quantile = quantile
+        self.interval = interval
+        self.window = window
+        self.min_count = min_count
+        self.group_by = list(group_by)
+        self.group_index = [list(fields).index(name) for name in self.group_by]
+        self.relative_accuracy = relative_accuracy
+        self.state_path = state_path
+        self.flush_rows = flush_rows
+        # key -> [previous window or None, current window]
+        self.sketches = {}
+        # (errors, groups) of the batches observed since the last flush
+        self.pending = []
+        self.pending_rows = 0
+        self.version = 0
+        self.last_update = time.monotonic()
+        if state_path and os.path.exists(state_path):
+            self.merge_state(state_path)
+
+    def row_groups(self, lines):
+        """Group key of each CSV line, None without group_by."""
+        if not self.group_index:
+            return None
+        index = self.group_index
+        last = max(index) + 1
+        return ['/'.join([parts[i] for i in index]) for parts in (line.split(',', last) for line in lines)]
+
+    def row_thresholds(self, groups=None):
+        """The threshold for a batch: a scalar, or one value per row with group_by."""
+        if groups is None or not self.group_thresholds:
+            return self.threshold
+        get = self.group_thresholds.get
+        threshold = self.threshold
+        return np.array([get(group, threshold) for group in groups])
+
+    def _add(self, key, errors):
+        pair = self.sketches.get(key)
+        if pair is None:
+            pair = self.sketches[key] = [None, QuantileSketch(self.relative_accuracy)]
+        pair[1].update(errors)
+        if self.window and pair[1].count >= self.window:
+            pair[0], pair[1] = pair[1], QuantileSketch(self.relative_accuracy)
+
+    def observe(self, errors, groups=None):
+        errors = np.asarray(errors, dtype=np.float64)
+        if self.max_change:
+            # A fixed cap, capping at the threshold in use would only ever let it move down
+            errors = np.minimum(errors, self.trained_threshold * self.max_change)
+        self.pending.append((errors, groups))
+        self.pending_rows += len(errors)
+        if self.pending_rows >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self._add(overall_key, np.concatenate([errors for errors, _ in self.pending]))
+        grouped = [(errors, groups) for errors, groups in self.pending if groups is not None]
+        if grouped:
+            errors = np.concatenate([errors for errors, _ in grouped])
+            keys, inverse = np.unique(np.array([group for _, groups in grouped for group in groups]),
+                                      return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+            for i, key in enumerate(keys.tolist()):
+                self._add(key, errors[order[bounds[i]:bounds[i + 1]]])
+        self.pending = []
+        self.pending_rows = 0
+
+    def estimate(self, key=overall_key):
+        pair = self.sketches.get(key)
+        if pair is None:
+            return None
+        sketch = pair[1] if pair[0] is None else pair[0].copy().merge(pair[1])
+        if sketch.count < self.min_count:
+            return None
+        return sketch.quantile(self.quantile)
+
+    def bounded(self, threshold):
+        if not self.max_change:
+            return threshold
+        return min(max(threshold, self.trained_threshold / self.max_change), self.trained_threshold * self.max_change)
+
+    def update(self):
+        """Recompute the thresholds from the sketches and persist them."""
+        self.flush()
+        overall = self.estimate()
+        if overall is not None:
+            self.threshold = self.bounded(overall)
+        group_thresholds = {}
+        for key in self.sketches:
+            if key != overall_key:
+                estimate = self.estimate(key)
+                if estimate is not None:
+                    group_thresholds[key] = self.bounded(estimate)
+        self.group_thresholds = group_thresholds
+        self.version += 1
+        self.last_update = time.monotonic()
+        self.save()
+
+    def maybe_update(self):
+        if time.monotonic() - self.last_update < self.interval:
+            return False
+        self.update()
+        return True
+
+    def reset(self, threshold):
+        """Start over from `threshold`, e.g. after a model swap changed what the errors mean."""
+        self.threshold = float(threshold)
+        self.trained_threshold = float(threshold)
+        self.group_thresholds = {}
+        self.sketches = {}
+        self.pending = []
+        self.pending_rows = 0
+        self.last_update = time.monotonic()
+
+    def count(self, key=overall_key):
+        self.flush()
+        pair = self.sketches.get(key)
+        return sum(sketch.count for sketch in pair if sketch is not None) if pair else 0
+
+    def save(self):
+        if self.path:
+            write_json_atomic({
+                'threshold': self.threshold,
+                'trained_threshold': self.trained_threshold,
+                'groups': self.group_thresholds,
+                'group_by': self.group_by,
+                'quantile': self.quantile,
+                'count': self.count(),
+                'version': self.version,
+                'updated': time.time(),
+            }, self.path)
+        if self.state_path:
+            write_json_atomic({key: [None if sketch is None else sketch.to_dict() for sketch in pair]
+                               for key, pair in self.sketches.items()}, self.state_path)
+
+    def merge_state(self, path):
+        """Add the sketches saved at path, e.g. by another scoring process, to this calibrator's."""
+        with open(path) as f:
+            state = json.load(f)
+        for key, pair in state.items():
+            own = self.sketches.get(key)
+            if own is None:
+                own = self.sketches[key] = [None, QuantileSketch(self.relative_accuracy)]
+            for i, sketch in enumerate(pair):
+                if sketch is None:
+                    continue
+                if own[i] is None:
+                    own[i] = QuantileSketch.from_dict(sketch)
+                else:
+                    own[i].merge(QuantileSketch.from_dict(sketch))
@@ -1,14 +1,18 @@
 import redis
+from record_codec import RecordDecoder
 
-r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+# Raw responses, so packed records from network_logger --record_format packed can be shown too
+r = redis.Redis(host='localhost', port=6379)
+decoder = RecordDecoder(r)
 last_id = '$'  # Start from latest
 
 print("=== Listening to Redis stream (Ctrl+C to stop) ===")
 while True:
     response = r.xread({"network_logs": last_id}, block=0)  # Block forever until new data
     for stream, messages in response:
-        for entry_id, data in messages:
-            print(f"\nNew Entry: {entry_id}")
+        rows = decoder.to_dicts([data for entry_id, data in messages])
+        for (entry_id, _), data in zip(messages, rows):
+            print(f"\nNew Entry: {entry_id.decode()}")
             for k, v in data.items():
                 print(f"  {k}: {v}")
             last_id = entry_id
@@ -0,0 +1,161 @@
+from collections import deque
+
+# KDD connection statuses that count as SYN errors and as rejections
+serror_flags = frozenset(('S0', 'S1', 'S2', 'S3', 'SH', 'RSTOS0'))
+rerror_flags = frozenset(('REJ',))
+
+
+def connection_errors(flag):
+    return int(flag in serror_flags), int(flag in rerror_flags)
+
+def _increment(counter, key, amount=1):
+    counter[key] = counter.get(key, 0) + amount
+
+def _decrement(counter, key, amount=1):
+    # Drop keys that reach zero so the counters only hold what is in the window
+    value = counter[key] - amount
+    if value:
+        counter[key] = value
+    else:
+        del counter[key]
+
+def _rate(part, total):
+    return round(part / total, 2) if total else 0
+
+
+class TimeWindowStats:
+    """
+    KDD time-based traffic features over the connections of the last `window`
+    seconds. Counters are updated when a connection enters or leaves the
+    window, so each connection costs O(1) amortised instead of a scan.
+    Connections may be added out of timestamp order (idle flows are reported
+    late); the window is kept sorted and ends at the latest timestamp seen.
+    """
+
+    def __init__(self, window=2):
+        self.window = window
+        self.connections = deque()  # (timestamp, dst, dport, serror, rerror), sorted by timestamp
+        self.latest = None
+        self.host = {}
+        self.service = {}
+        self.host_serror = {}
+        self.service_serror = {}
+        self.host_rerror = {}
+        self.service_rerror = {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def add(self, now, dst, dport, serror=0, rerror=0):
+        if self.latest is None or now > self.latest:
+            self.latest = now
+        self.expire(self.latest)
+        if self.latest - now > self.window:
+            # Reported too late to fall inside the current window
+            return
+        connection = (now, dst, dport, serror, rerror)
+        connections = self.connections
+        if not connections or connections[-1][0] <= now:
+            connections.append(connection)
+        else:
+            # Late connections are close to the end, search from there
+            i = len(connections) - 1
+            while i > 0 and connections[i - 1][0] > now:
+                i -= 1
+            connections.insert(i, connection)
+        service_key = (dst, dport)
+        _increment(self.host, dst)
+        _increment(self.service, service_key)
+        if serror:
+            _increment(self.host_serror, dst)
+            _increment(self.service_serror, service_key)
+        if rerror:
+            _increment(self.host_rerror, dst)
+            _increment(self.service_rerror, service_key)
+
+    def expire(self, now):
+        connections = self.connections
+        while connections and now - connections[0][0] > self.window:
+            _, dst, dport, serror, rerror = connections.popleft()
+            service_key = (dst, dport)
+            _decrement(self.host, dst)
+            _decrement(self.service, service_key)
+            if serror:
+                _decrement(self.host_serror, dst)
+                _decrement(self.service_serror, service_key)
+            if rerror:
+                _decrement(self.host_rerror, dst)
+                _decrement(self.service_rerror, service_key)
+
+    def features(self, dst, dport):
+        service_key = (dst, dport)
+        count = self.host.get(dst, 0)
+        srv_count = self.service.get(service_key, 0)
+        return {
+            "count": count,
+            "srv_count": srv_count,
+            "serror_rate": _rate(self.host_serror.get(dst, 0), count),
+            "srv_serror_rate": _rate(self.service_serror.get(service_key, 0), srv_count),
+            "rerror_rate": _rate(self.host_rerror.get(dst, 0), count),
+            "srv_rerror_rate": _rate(self.service_rerror.get(service_key, 0), srv_count),
+        }
+
+
+class HostWindowStats:
+    """
+    KDD host-based traffic features over the last `size` connections,
+    maintained with the same add/expire counters as TimeWindowStats.
+    """
+
+    def __init__(self, size=100):
+        self.size = size
+        self.connections = deque()  # (dst, dport, sport, serror, rerror)
+        self.host = {}
+        self.service = {}
+        self.host_service = {}
+        self.host_src_port = {}
+        self.host_serror = {}
+        self.service_serror = {}
+        self.host_rerror = {}
+        self.service_rerror = {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def _update(self, connection, update):
+        dst, dport, sport, serror, rerror = connection
+        update(self.host, dst)
+        update(self.service, dport)
+        update(self.host_service, (dst, dport))
+        update(self.host_src_port, (dst, sport))
+        if serror:
+            update(self.host_serror, dst)
+            update(self.service_serror, dport)
+        if rerror:
+            update(self.host_rerror, dst)
+            update(self.service_rerror, dport)
+
+    def add(self, dst, dport, sport, serror=0, rerror=0):
+        connection = (dst, dport, sport, serror, rerror)
+        self.connections.append(connection)
+        self._update(connection, _increment)
+        if len(self.connections) > self.size:
+            self._update(self.connections.popleft(), _decrement)
+
+    def features(self, dst, dport, sport):
+        host_count = self.host.get(dst, 0)
+        srv_count = self.service.get(dport, 0)
+        same_srv = self.host_service.get((dst, dport), 0)
+        same_srv_rate = _rate(same_srv, host_count)
+        return {
+            "dst_host_count": host_count,
+            "dst_host_srv_count": srv_count,
+            "dst_host_same_srv_rate": same_srv_rate,
+            "dst_host_diff_srv_rate": round(1 - same_srv_rate, 2) if host_count else 0,
+            "dst_host_same_src_port_rate": _rate(self.host_src_port.get((dst, sport), 0), host_count),
+            "dst_host_srv_diff_host_rate": _rate(srv_count - same_srv, srv_count),
+            "dst_host_serror_rate": _rate(self.host_serror.get(dst, 0), host_count),
+            "dst_host_srv_serror_rate": _rate(self.service_serror.get(dport, 0), srv_count),
+            "dst_host_rerror_rate": _rate(self.host_rerror.get(dst, 0), host_count),
+            "dst_host_srv_rerror_rate": _rate(self.service_rerror.get(dport, 0), srv_count),
+        }
@@ -0,0 +1,259 @@
+import argparse
+import multiprocessing
+import os
+import time
+import numpy as np
+import redis
+import metrics
+import results_ring
+import serve
+from threshold_calibrator import ThresholdCalibrator, load_thresholds, load_trained_threshold
+
+stream_name = 'network_logs'
+group_name = 'scorers'
+
+
+def ensure_group(r, stream=stream_name, group=group_name):
+    # New groups start at the end of the stream, like the single consumer's '$'
+    try:
+        r.xgroup_create(stream, group, id='$', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+def read_group_batch(r, consumer, batch_size, max_latency_ms, stream=stream_name, group=group_name):
+    def read(count, block):
+        return r.xreadgroup(group, consumer, {stream: '>'}, count=count, block=block)
+
+    return serve.drain_stream(read, batch_size, max_latency_ms)
+
+def read_own_pending(r, consumer, start_id, batch_size, stream=stream_name, group=group_name):
+    # Entries this consumer name read but never acknowledged, e.g. before a crash
+    response = r.xreadgroup(group, consumer, {stream: start_id}, count=batch_size)
+    return [message for _, messages in response for message in messages]
+
+def claim_stale(r, consumer, cursor, min_idle_ms, batch_size, stream=stream_name, group=group_name):
+    """
+    Take over entries that another (dead or stuck) worker has held for longer
+    than min_idle_ms. Returns the cursor for the next call and the claimed messages.
+    """
+    response = r.xautoclaim(stream, group, consumer, min_idle_ms, start_id=cursor, count=batch_size)
+    return response[0], response[1]
+
+def group_backlog(r, stream=stream_name, group=group_name):
+    """(lag, pending) of the consumer group from XINFO GROUPS; lag is None before Redis 7."""
+    for info in r.xinfo_groups(stream):
+        name = info['name']
+        if (name.decode() if isinstance(name, bytes) else name) == group:
+            return info.get('lag'), info['pending']
+    return None, 0
+
+def process_messages(r, messages, model, standard_scaler, threshold, feature_columns,
+                     stream=stream_name, group=group_name, ring=None, cache=None, decoder=None, calibrator=None,
+                     instruments=None):
+    # instruments: serve.consumer_metrics() of the worker's registry, or None
+    stages = instruments[0] if instruments is not None else None
+    # Entries trimmed from the stream come back without data, they only need acknowledging
+    entry_ids = [entry_id for entry_id, _ in messages]
+    entries = [data for _, data in messages if data]
+    suspicious = 0
+    if entries:
+        results, reconstruction_errors, lines, log_rows = serve.score_entries(
+            entries, model, standard_scaler, threshold, feature_columns, cache, decoder, calibrator,
+            stages[1:4] if stages else None)
+        suspicious = int(np.sum(results == 'S'))
+    t0 = time.perf_counter()
+    if entries:
+        serve.write_results(results, lines)
+        if ring is not None:
+            ring.append(results, reconstruction_errors, log_rows)
+    r.xack(stream, group, *entry_ids)
+    if instruments is not None:
+        _, batch_rows, rows_scored, rows_suspicious = instruments
+        stages[4].observe(time.perf_counter() - t0)
+        batch_rows.observe(len(entries))
+        rows_scored.inc(len(entries))
+        rows_suspicious.inc(suspicious)
+    return len(entries)
+
+def worker_state_path(args, index):
+    return f'{args.threshold_sketch_path}.worker-{index}'
+
+def open_calibrator(args, threshold, path=None, state_path=None):
+    return ThresholdCalibrator(threshold, path, args.threshold_quantile, args.recalibrate_interval,
+                               args.threshold_window, args.threshold_min_count,
+                               [field for field in args.threshold_group_by.split(',') if field], serve.all_fields,
+                               state_path=state_path, max_change=args.threshold_max_change,
+                               trained_threshold=load_trained_threshold(args.threshold_path))
+
+def merge_thresholds(args, threshold):
+    """
+    Merge the sketches every worker saved into one calibrator and write the
+    thresholds it gives to threshold_path, for the workers to pick up.
+    """
+    calibrator = open_calibrator(args, threshold, args.threshold_path)
+    for index in range(args.workers):
+        state_path = worker_state_path(args, index)
+        if os.path.exists(state_path):
+            calibrator.merge_state(state_path)
+    calibrator.update()
+    return calibrator
+
+def worker_main(index, args, processed):
+    model, standard_scaler, threshold, feature_columns = serve.load_artifacts(
+        args.model_path, args.scaler_path, args.threshold_path, args.features_path,
+        args.engine, args.weights_path, args.dtype)
+    r = serve.redis_client(args.redis_host, args.redis_port, args.record_format)
+    decoder = serve.record_decoder(r, args.record_format)
+    ensure_group(r, args.stream, args.group)
+    # Appends from the workers are serialized with a file lock on the shared ring
+    ring = serve.open_ring(args.ring_path, feature_columns, args.ring_capacity)
+    cache = serve.open_cache(args.cache_size, args.cache_quantum, args.engine, args.model_path, args.weights_path,
+                             args.scaler_path)
+    # Each worker only saves its own sketches, the supervisor merges them into threshold_path
+    calibrator = None
+    if args.recalibrate_interval > 0:
+        calibrator = open_calibrator(args, threshold, state_path=worker_state_path(args, index))
+
+    # Same stage histograms as the single consumer, one endpoint / file per worker
+    registry = metrics.Registry()
+    instruments = serve.consumer_metrics(registry)
+    read_time = instruments[0][0]
+    lag_gauge = registry.gauge('group_lag', 'Stream entries not delivered to the consumer group yet (Redis 7+)')
+    pending_gauge = registry.gauge('group_pending', 'Entries delivered to the consumer group but not acknowledged')
+    exporter = metrics.Exporter(registry, args.metrics_port + index if args.metrics_port else 0,
+                                f'{args.metrics_file}.worker-{index}' if args.metrics_file else None)
+    lag_check = metrics.SampledLogger(1.0)
+
+    # Stable consumer names, so a respawned worker picks up what its predecessor left pending
+    consumer = f'worker-{index}'
+    pending_id = '0'
+    claim_cursor = '0-0'
+    last_claim = time.monotonic()
+
+    while True:
+        t0 = time.perf_counter()
+        if pending_id is not None:
+            messages = read_own_pending(r, consumer, pending_id, args.batch_size, args.stream, args.group)
+            pending_id = messages[-1][0] if messages else None
+        else:
+            messages = read_group_batch(r, consumer, args.batch_size, args.max_latency_ms, args.stream, args.group)
+
+        if time.monotonic() - last_claim >= args.claim_interval:
+            claim_cursor, claimed = claim_stale(r, consumer, claim_cursor, args.claim_idle_ms,
+                                                args.batch_size, args.stream, args.group)
+            messages += claimed
+            last_claim = time.monotonic()
+        read_time.observe(time.perf_counter() - t0)
+
+        if lag_check.ready():
+            lag, pending = group_backlog(r, args.stream, args.group)
+            if lag is not None:
+                lag_gauge.set(lag)
+            pending_gauge.set(pending)
+        exporter.poll()
+        if not messages:
+            continue
+
+        scored = process_messages(r, messages, model, standard_scaler, threshold, feature_columns,
+                                  args.stream, args.group, ring, cache, decoder, calibrator, instruments)
+        if calibrator is not None and calibrator.maybe_update():
+            calibrator.threshold, calibrator.group_thresholds = load_thresholds(args.threshold_path)
+        with processed.get_lock():
+            processed[index] += scored
+
+def start_worker(context, index, args, processed):
+    worker = context.Process(target=worker_main, args=(index, args, processed), name=f'worker-{index}', daemon=True)
+    worker.start()
+    return worker
+
+def supervise(args):
+    # Each worker runs its own model, so keep BLAS / TensorFlow to a few threads per process
+    serve.limit_threads(args.threads_per_worker)
+
+    # Create the results ring up front so the workers don't race to initialize it
+    ring = serve.open_ring(args.ring_path, serve.load_feature_schema(args.features_path), args.ring_capacity)
+    if ring is not None:
+        ring.close()
+
+    context = multiprocessing.get_context('spawn')
+    processed = context.Array('q', args.workers)
+    workers = [start_worker(context, i, args, processed) for i in range(args.workers)]
+    print(f"Started {args.workers} workers in consumer group '{args.group}' on '{args.stream}'")
+
+    last_counts = np.zeros(args.workers, dtype=np.int64)
+    last_report = last_merge = time.monotonic()
+    threshold, _ = load_thresholds(args.threshold_path)
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            for i, worker in enumerate(workers):
+                if not worker.is_alive():
+                    print(f"worker-{i} exited with code {worker.exitcode}, restarting")
+                    workers[i] = start_worker(context, i, args, processed)
+
+            now = time.monotonic()
+            with processed.get_lock():
+                counts = np.array(processed[:], dtype=np.int64)
+            rates = (counts - last_counts) / (now - last_report)
+            per_worker = ', '.join(f"worker-{i}: {rate:.0f}" for i, rate in enumerate(rates))
+            print(f"rows/sec total: {rates.sum():.0f} ({per_worker})")
+            last_counts, last_report = counts, now
+
+            if args.recalibrate_interval > 0 and now - last_merge >= args.recalibrate_interval:
+                calibrator = merge_thresholds(args, threshold)
+                threshold = calibrator.threshold
+                print(f"Threshold {threshold:.6f} from {calibrator.count()} rows, "
+                      f"{len(calibrator.group_thresholds)} group thresholds")
+                last_merge = now
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score the Redis stream with K worker processes in a consumer group')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads_per_worker', type=int, default=1)
+    parser.add_argument('--stream', default=stream_name)
+    parser.add_argument('--group', default=group_name)
+    parser.add_argument('--claim_interval', type=float, default=5.0, help='Seconds between scans for stale pending entries')
+    parser.add_argument('--claim_idle_ms', type=int, default=30000, help='Pending entries idle this long are reclaimed from dead workers')
+    parser.add_argument('--report_interval', type=float, default=10.0)
+    parser.add_argument('--metrics_port', type=int, default=0,
+                        help='Worker i serves Prometheus metrics on this local port + i, 0 to turn it off')
+    parser.add_argument('--metrics_file', default=None, help='Worker i also writes its metrics to <file>.worker-<i>')
+    parser.add_argument('--model_path', default=serve.model_path)
+    parser.add_argument('--scaler_path', default=serve.scaler_path)
+    parser.add_argument('--threshold_path', default=serve.threshold_path)
+    parser.add_argument('--features_path', default=serve.features_path)
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='numpy')
+    parser.add_argument('--weights_path', default=serve.weights_path)
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64')
+    parser.add_argument('--redis_host', default='localhost')
+    parser.add_argument('--redis_port', type=int, default=6379)
+    parser.add_argument('--record_format', choices=['text', 'packed'], default='text',
+                        help='packed also accepts binary records from network_logger --record_format packed')
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--max_latency_ms', type=int, default=50)
+    parser.add_argument('--ring_path', default=serve.ring_path, help="Memory-mapped history of scored records, '' to turn it off")
+    parser.add_argument('--ring_capacity', type=int, default=100000)
+    parser.add_argument('--cache_size', type=int, default=65536, help='Reconstruction errors kept for repeated rows, 0 to turn the cache off')
+    parser.add_argument('--cache_quantum', type=float, default=0.0, help='Round scaled features to this step for cache keys, 0 for exact matches')
+    parser.add_argument('--recalibrate_interval', type=float, default=0.0,
+                        help='Seconds between threshold recalibrations from the scored errors, 0 to keep the saved threshold')
+    parser.add_argument('--threshold_quantile', type=float, default=0.999, help='Quantile of the reconstruction errors used as threshold')
+    parser.add_argument('--threshold_window', type=int, default=1000000, help='Rows after which older errors start to age out, 0 to keep all')
+    parser.add_argument('--threshold_min_count', type=int, default=1000, help='Rows needed before a threshold is recalibrated')
+    parser.add_argument('--threshold_group_by', default='', help="Comma separated fields with their own threshold, e.g. 'protocol_type,service'")
+    parser.add_argument('--threshold_sketch_path', default=serve.sketch_path, help='Prefix of the per-worker sketch files')
+    parser.add_argument('--threshold_max_change', type=float, default=2.0,
+                        help='Recalibrated thresholds stay within this factor of the trained threshold, 0 for no bound')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.features_path):
+        parser.error(f"{args.features_path} not found, run main.py once to write the feature schema")
+    if args.ring_path and results_ring.fcntl is None:
+        parser.error("Workers can only share the results ring with fcntl locks, pass --ring_path '' on this platform")
+
+    supervise(args)